@@ -2,10 +2,56 @@
 """
 A tool for sorting text with human-readable byte sizes like "2.5 KiB" or "6TB"
 Example uses include sorting the output of "du -h" or "docker image ls".
+
+The size parsing can also be imported: see build_multiples, parse_size,
+parse_sizes and (when NumPy is installed) parse_sizes_np.
 """
 import argparse
+import contextlib
+import functools
+import heapq
+import itertools
+import multiprocessing
+import operator
+import os
 import re
 import sys
+import tempfile
+from array import array
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+if TYPE_CHECKING:
+    import numpy
+
+# the approximate number of bytes of bookkeeping each buffered line costs in
+# addition to the line itself: the (size, line) tuple, the size and the list slot
+RECORD_OVERHEAD = 88
+
+# LineStore stops counting distinct sizes (and falls back to a comparison sort)
+# once it has seen more than this many of them
+MAX_DISTINCT_SIZES = 1 << 16
+
+# the maximum number of sorted runs --buffer-size merges at once
+MAX_MERGE_FANIN = 64
+
+# the number of input lines handed to each worker process by --parallel
+PARALLEL_CHUNK_LINES = 1 << 16
 
 # byte size multiples are hard. https://en.wikipedia.org/wiki/Kibibyte
 
@@ -80,6 +126,563 @@ CLASSIC_MULTIPLES = {
 # fmt: on
 
 
+def build_multiples(
+    classic: bool = False,
+    strict_classic: bool = False,
+    strict: bool = False,
+) -> Dict[str, int]:
+    """
+    return a new dict of size labels to byte multiples, selected the same way
+    as by hsort's --classic, --strict-classic and --strict options
+    """
+    multiples = dict(IEC_MULTIPLES)
+
+    if not strict:
+        multiples.update(IEC_KILO_PATCH)
+
+    if classic:
+        multiples.update(CLASSIC_MULTIPLES)
+
+    if strict_classic:
+        multiples = dict(CLASSIC_MULTIPLES)
+
+    return multiples
+
+
+DEFAULT_MULTIPLES = build_multiples()
+
+# input lines are str, or bytes when reading in --binary mode
+Line = Union[str, bytes]
+
+# a sort key is the size of the line, or a tuple of per-field keys when sorting
+# by fields with --key
+Key = Union[int, Tuple[Union[int, Line], ...]]
+Record = Tuple[Key, Line]
+
+
+class KeySpec(NamedTuple):
+    """a --key definition: a 1-based field number and how to compare it"""
+
+    field: int
+    size: bool  # compare by data size if True, otherwise lexically
+
+
+# a number which starts a word, optional whitespace, then a run of letters which
+# ends at a word boundary; match groups are the whole and fractional digits of
+# the number and the label, like ('98', '6', 'MB') or ('228', None, 'K').
+# the letters must end the word, so the whole run is the only candidate label
+# and a plain dict lookup of it is a longest-match lookup of the size label
+SIZE_TOKEN_REGEX = re.compile(r"(?<!\w)(\d+)(?:\.(\d+))?\s*([A-Za-z]+)\b")
+SIZE_TOKEN_BYTES_REGEX = re.compile(rb"(?<!\w)(\d+)(?:\.(\d+))?\s*([A-Za-z]+)\b")
+
+# powers of ten for scaling the fractional digits of sizes
+POWERS_OF_TEN = [10**exponent for exponent in range(64)]
+
+# sort keys count thousandths of a byte, so sizes which only differ by a
+# fraction of a byte, like 1.1B and 1.9B, still sort apart; keys fit an
+# unsigned 64-bit integer up to 16 PiB
+SIZE_SCALE = 10**3
+
+# the placeholder LineStore keeps in its array of sizes for a size too large
+# for it, whose actual value is kept on the side
+LARGE_SIZE = (1 << 64) - 1
+
+# the read size used for --binary input
+BLOCK_SIZE = 1 << 20
+
+
+def scaled_size(whole: Line, fraction: Optional[Line], multiple: int) -> int:
+    """
+    return the decimal number with the given whole and fractional digits (as
+    str or bytes) times multiple, in units of 1/SIZE_SCALE bytes. integer
+    arithmetic keeps this exact for every multiple, where floats lose
+    precision beyond 2**53 bytes; only fractions finer than the scale are
+    truncated
+    """
+    if not fraction:
+        return int(whole) * multiple * SIZE_SCALE
+    if len(fraction) < len(POWERS_OF_TEN):
+        scale = POWERS_OF_TEN[len(fraction)]
+    else:
+        scale = 10 ** len(fraction)
+    return int(whole + fraction) * multiple * SIZE_SCALE // scale
+
+
+def find_size(
+    line: Line,
+    multiples: Dict[Any, int],
+    pattern: "re.Pattern[Any]" = SIZE_TOKEN_REGEX,
+) -> Optional[int]:
+    """
+    return the size described by the first data size expression in the given
+    line whose label is in multiples, in units of 1/SIZE_SCALE bytes, or None
+    if there isn't one. bytes lines work too, given SIZE_TOKEN_BYTES_REGEX and
+    bytes labels
+    """
+    match = pattern.search(line)
+    while match is not None:
+        whole, fraction, label = match.groups()
+        multiple = multiples.get(label)
+        if multiple is not None:
+            return scaled_size(whole, fraction, multiple)
+        match = pattern.search(line, match.end())
+    return None
+
+
+def size_records(
+    lines: Iterable[Line],
+    multiples: Dict[Any, int],
+    only_matches: bool = False,
+    keys: Sequence[KeySpec] = (),
+    separator: Optional[Line] = None,
+    binary: bool = False,
+) -> Iterator[Record]:
+    """
+    generate (key, line) tuples for the given lines. lines which don't contain
+    a recognized data size expression get a size of 0, or are skipped entirely
+    if only_matches is True. like sort(1), a final line without a trailing
+    newline gets one.
+
+    by default the key is the first size found anywhere in the line. if keys
+    are given, only the selected fields of the line are parsed. the line is
+    split into fields on separator (or on runs of whitespace if it is None)
+    and the key is the tuple of the field keys, or just the field key itself
+    when there is only one.
+
+    in binary mode the lines are bytes, and so are the multiples labels and
+    the separator
+    """
+    newline: Line = b"\n" if binary else "\n"
+    empty: Line = b"" if binary else ""
+    pattern = SIZE_TOKEN_BYTES_REGEX if binary else SIZE_TOKEN_REGEX
+    maxsplit = max([spec.field for spec in keys], default=0)
+    for line in lines:
+        if not line.endswith(newline):
+            line += newline
+
+        if not keys:
+            size = find_size(line, multiples, pattern)
+            if size is None:
+                if not only_matches:
+                    yield 0, line
+                continue
+            yield size, line
+            continue
+
+        fields = line[:-1].split(separator, maxsplit)
+        matched = True
+        key: List[Union[int, Line]] = []
+        for spec in keys:
+            field = fields[spec.field - 1] if spec.field <= len(fields) else empty
+            if not spec.size:
+                key.append(field)
+                continue
+            size = find_size(field, multiples, pattern)
+            if size is None:
+                matched = False
+                size = 0
+            key.append(size)
+        if not matched and only_matches:
+            continue
+        yield (key[0] if len(key) == 1 else tuple(key)), line
+
+
+class LineStore:
+    """
+    compact storage for input lines and their sizes. rather than keeping one
+    object per line, the lines are packed end-to-end into a single utf-8 buffer
+    and addressed by offset, and the sizes are kept in a parallel array of
+    unsigned 64-bit integers (or a list, for keys which aren't integers, like
+    the key tuples of --key). the few sizes too large for the array, of 16 PiB
+    and up, are kept in a dict by record index instead. sorting is stable and
+    preserves duplicate lines. in binary mode the lines are stored and
+    returned as bytes, unchanged
+    """
+
+    def __init__(self, binary: bool = False) -> None:
+        self.binary = binary
+        self.buffer = bytearray()
+        self.offsets = array("Q", [0])
+        self.sizes: Union["array[int]", List[Key]] = array("Q")
+        self.large: Dict[int, Key] = {}
+        self.counts: Optional[Dict[Key, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def append(self, size: Key, line: Line) -> None:
+        """add a line and its size to the store"""
+        self.buffer += line if self.binary else line.encode("utf-8", "surrogateescape")
+        self.offsets.append(len(self.buffer))
+        try:
+            self.sizes.append(size)
+        except OverflowError:
+            self.large[len(self.sizes)] = size
+            self.sizes.append(LARGE_SIZE)
+        except TypeError:
+            self.sizes = list(self.sizes)
+            self.sizes.append(size)
+        if self.counts is not None:
+            self.counts[size] = self.counts.get(size, 0) + 1
+            if len(self.counts) > MAX_DISTINCT_SIZES:
+                self.counts = None
+
+    def size(self, index: int) -> Key:
+        """return the size of the record at the given index"""
+        size = self.sizes[index]
+        return self.large.get(index, size) if size == LARGE_SIZE else size
+
+    def order(self, reverse: bool = False) -> "array[int]":
+        """
+        return the record indices ordered by size. human-readable sizes only
+        take a few thousand distinct values, so this is a counting sort over
+        the distinct sizes which needs no per-record objects. when most sizes
+        are distinct it falls back to a regular sort of the indices
+        """
+        sizes = self.sizes
+        large = self.large
+        counts = self.counts
+        if counts is None:
+            key = self.size if large else sizes.__getitem__
+            return array("Q", sorted(range(len(sizes)), key=key, reverse=reverse))
+
+        # starts[rank] is the position of the next record having that rank
+        ranks = {}
+        starts = array("Q")
+        position = 0
+        for rank, size in enumerate(sorted(counts, reverse=reverse)):
+            ranks[size] = rank
+            starts.append(position)
+            position += counts[size]
+
+        order = array("Q", bytes(8 * len(sizes)))
+        for index, size in enumerate(sizes):
+            if size == LARGE_SIZE:
+                size = large.get(index, size)
+            rank = ranks[size]
+            order[starts[rank]] = index
+            starts[rank] += 1
+        return order
+
+    def sorted_lines(self, reverse: bool = False) -> Iterator[Line]:
+        """generate the stored lines ordered by size"""
+        data = self.buffer
+        offsets = self.offsets
+        if self.binary:
+            view = memoryview(data)
+            for index in self.order(reverse=reverse):
+                yield view[offsets[index] : offsets[index + 1]]
+            return
+        for index in self.order(reverse=reverse):
+            yield data[offsets[index] : offsets[index + 1]].decode(
+                "utf-8", "surrogateescape"
+            )
+
+
+def _parse_size(value: str, multiples: Dict[str, int]) -> int:
+    """
+    return the number of bytes in the given data size string, which must be a
+    bare number of bytes or a single data size expression like "2.5 KiB"
+    """
+    value = value.strip()
+    if value.isdecimal():
+        return int(value)
+    match = SIZE_TOKEN_REGEX.fullmatch(value)
+    if match:
+        whole, fraction, label = match.groups()
+        multiple = multiples.get(label)
+        if multiple is not None:
+            return scaled_size(whole, fraction, multiple) // SIZE_SCALE
+    raise ValueError("invalid data size: {!r}".format(value))
+
+
+def parse_size(value: str, multiples: Optional[Dict[str, int]] = None) -> int:
+    """
+    return the number of bytes in the given data size string, e.g. "2.5 KiB"
+    or "6TB"; the labels and their multiples default to those hsort uses
+    without options (see build_multiples). raises ValueError if the string is
+    not a data size
+    """
+    if multiples is None:
+        multiples = DEFAULT_MULTIPLES
+    return _parse_size(value, multiples)
+
+
+def parse_sizes(
+    values: Iterable[str],
+    multiples: Optional[Dict[str, int]] = None,
+    default: Optional[float] = None,
+) -> "array[float]":
+    """
+    batch version of parse_size, returns an array of doubles (so it can be
+    shared with NumPy; use parse_size for exact values). invalid values
+    raise ValueError, unless a default is given to use in their place. data
+    size strings repeat a lot in practice, so each distinct string is only
+    parsed once (up to MAX_DISTINCT_SIZES of them are remembered)
+    """
+    if multiples is None:
+        multiples = DEFAULT_MULTIPLES
+    result = array("d")
+    append = result.append
+    parsed: Dict[str, float] = {}
+    for value in values:
+        size = parsed.get(value)
+        if size is None:
+            try:
+                size = float(_parse_size(value, multiples))
+            except ValueError:
+                if default is None:
+                    raise
+                size = default
+            if len(parsed) < MAX_DISTINCT_SIZES:
+                parsed[value] = size
+        append(size)
+    return result
+
+
+def parse_sizes_np(
+    values: Iterable[str],
+    multiples: Optional[Dict[str, int]] = None,
+    default: Optional[float] = None,
+) -> "numpy.ndarray":
+    """
+    like parse_sizes, but returns a float64 NumPy array (sharing the memory of
+    the parse_sizes result rather than copying it); requires NumPy, which is
+    only imported here so that the command line tool never pays for it
+    """
+    try:
+        import numpy  # pylint: disable=import-outside-toplevel
+    except ImportError as err:
+        raise RuntimeError(
+            "parse_sizes_np requires numpy, which is not installed"
+        ) from err
+    return numpy.frombuffer(
+        parse_sizes(values, multiples, default), dtype=numpy.float64
+    )
+
+
+def parse_buffer_size(value: str) -> int:
+    """
+    argparse type for human-readable memory budgets like "512M" or "2GiB"
+    """
+    try:
+        size = parse_size(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err)) from err
+    if size < 1:
+        raise argparse.ArgumentTypeError("size must be at least 1 byte")
+    return size
+
+
+def spill(records: Iterable[Record], binary: bool = False) -> IO[Any]:
+    """
+    write the lines of the given (already sorted) records to a temporary file
+    and return it, rewound to the beginning and ready for reading
+    """
+    if binary:
+        runfile: IO[Any] = tempfile.TemporaryFile("w+b", buffering=BLOCK_SIZE)
+    else:
+        runfile = tempfile.TemporaryFile(
+            "w+", encoding="utf-8", errors="surrogateescape"
+        )
+    runfile.writelines(map(operator.itemgetter(1), records))
+    runfile.seek(0)
+    return runfile
+
+
+def external_sort(
+    lines: Iterable[Line],
+    records: Callable[[Iterable[Line]], Iterator[Record]],
+    buffer_size: int,
+    reverse: bool = False,
+    binary: bool = False,
+) -> Iterator[Line]:
+    """
+    sort the given lines using no more than (roughly) buffer_size bytes of
+    memory. sorted runs which fill the buffer are spilled to temporary files
+    and the runs are then k-way merged. the records function turns lines into
+    (size, line) tuples, it is used both on the input and on the spilled runs.
+    to bound the number of open files, the runs are kept in tiers: whenever a
+    tier holds MAX_MERGE_FANIN runs they are merged into one run of the next
+    tier. older tiers only ever hold older runs, so merging tiers oldest-first
+    keeps the sort stable
+    """
+    by_size = operator.itemgetter(0)
+
+    def merge(runs: List[IO[Any]]) -> Iterator[Record]:
+        # heapq.merge favors earlier iterables on ties, so the merge is stable
+        return heapq.merge(
+            *[records(runfile) for runfile in runs], key=by_size, reverse=reverse
+        )
+
+    with contextlib.ExitStack() as stack:
+        tiers: List[List[IO[Any]]] = [[]]
+        run: List[Record] = []
+        run_size = 0
+        for record in records(lines):
+            run.append(record)
+            run_size += sys.getsizeof(record[1]) + RECORD_OVERHEAD
+            if run_size >= buffer_size:
+                run.sort(key=by_size, reverse=reverse)
+                tiers[0].append(stack.enter_context(spill(run, binary)))
+                run = []
+                run_size = 0
+                for tier, runs in enumerate(tiers):
+                    if len(runs) < MAX_MERGE_FANIN:
+                        break
+                    merged_run = stack.enter_context(spill(merge(runs), binary))
+                    for runfile in runs:
+                        runfile.close()
+                    runs.clear()
+                    if tier + 1 == len(tiers):
+                        tiers.append([])
+                    tiers[tier + 1].append(merged_run)
+        run.sort(key=by_size, reverse=reverse)
+
+        runs = [runfile for runs in reversed(tiers) for runfile in runs]
+        if not runs:
+            # everything fit in the buffer, no need to touch the disk
+            for _, line in run:
+                yield line
+            return
+
+        if run:
+            runs.append(stack.enter_context(spill(run, binary)))
+        del run
+
+        for _, line in merge(runs):
+            yield line
+
+
+def sort_chunk(
+    lines: List[Line],
+    records: Callable[[Iterable[Line]], Iterator[Record]],
+    reverse: bool = False,
+) -> Tuple[List[Key], List[Line]]:
+    """
+    worker function for --parallel; extract the sizes of the given chunk of
+    lines and sort it, returning the sorted sizes and lines as parallel lists
+    (which are cheaper to send back to the parent than a list of tuples)
+    """
+    run = list(records(lines))
+    run.sort(key=operator.itemgetter(0), reverse=reverse)
+    return [size for size, _ in run], [line for _, line in run]
+
+
+def parallel_sort(
+    lines: Iterable[Line],
+    records: Callable[[Iterable[Line]], Iterator[Record]],
+    processes: int,
+    reverse: bool = False,
+) -> Iterator[Line]:
+    """
+    sort the given lines by splitting them into chunks which are keyed and
+    sorted by a pool of worker processes, the sorted chunks are then merged.
+    the output is identical to that of a single-process stable sort
+    """
+    lines = iter(lines)
+    chunks = iter(lambda: list(itertools.islice(lines, PARALLEL_CHUNK_LINES)), [])
+    worker = functools.partial(sort_chunk, records=records, reverse=reverse)
+    with multiprocessing.Pool(processes) as pool:
+        # imap hands out chunks as they are read, rather than reading the
+        # whole input first like map, and still returns them in input order
+        sorted_chunks = list(pool.imap(worker, chunks))
+
+    # chunks are merged in input order and heapq.merge favors earlier
+    # iterables on ties, so equal sizes keep their input order
+    merged = heapq.merge(
+        *[zip(sizes, chunk) for sizes, chunk in sorted_chunks],
+        key=operator.itemgetter(0),
+        reverse=reverse,
+    )
+    for _, line in merged:
+        yield line
+
+
+def merge_sorted(
+    sorted_files: Iterable[Iterable[Line]],
+    records: Callable[[Iterable[Line]], Iterator[Record]],
+    reverse: bool = False,
+) -> Iterator[Line]:
+    """
+    merge the given inputs, each of which must already be sorted by size (in
+    descending order if reverse is True), without loading them into memory.
+    on ties, lines from earlier inputs come first
+    """
+    merged = heapq.merge(
+        *[records(lines) for lines in sorted_files],
+        key=operator.itemgetter(0),
+        reverse=reverse,
+    )
+    for _, line in merged:
+        yield line
+
+
+def select_lines(
+    lines: Iterable[Line],
+    records: Callable[[Iterable[Line]], Iterator[Record]],
+    top: Optional[int] = None,
+    bottom: Optional[int] = None,
+    reverse: bool = False,
+) -> List[Line]:
+    """
+    return the top (largest) or bottom (smallest) lines of the input in a
+    single streaming pass using a bounded heap, so memory use is proportional
+    to the number of lines selected. the top lines are ordered largest first
+    and the bottom lines smallest first, unless reverse is True. ties are
+    resolved in input order, as a stable sort would
+    """
+    by_size = operator.itemgetter(0)
+    if top is not None:
+        selected = heapq.nlargest(top, records(lines), key=by_size)
+    else:
+        selected = heapq.nsmallest(bottom or 0, records(lines), key=by_size)
+    if reverse:
+        selected.reverse()
+    return [line for _, line in selected]
+
+
+def binary_input(infile: TextIO) -> BinaryIO:
+    """
+    return a binary file object, with a large read buffer, for the same file
+    descriptor as the given (not yet read from) text mode file object
+    """
+    return open(infile.fileno(), "rb", buffering=BLOCK_SIZE, closefd=False)
+
+
+def key_spec(value: str) -> KeySpec:
+    """
+    argparse type for --key definitions: a field number optionally followed by
+    'h' (compare by data size, the default) or 'l' (compare lexically)
+    """
+    match = re.fullmatch(r"([1-9]\d*)([hl]?)", value.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(
+            "invalid key definition: {!r}".format(value)
+        )
+    return KeySpec(int(match.group(1)), match.group(2) != "l")
+
+
+def positive_int(value: str) -> int:
+    """argparse type for integers greater than zero"""
+    try:
+        result = int(value)
+    except ValueError:
+        result = 0
+    if result < 1:
+        raise argparse.ArgumentTypeError(
+            "expected a positive integer: {!r}".format(value)
+        )
+    return result
+
+
+def field_separator(value: str) -> str:
+    """argparse type for --field-separator, which can't be empty"""
+    if not value:
+        raise argparse.ArgumentTypeError("the field separator can't be empty")
+    return value
+
+
 def main():
     """command-line execution handler"""
     argp = argparse.ArgumentParser(
@@ -87,10 +690,10 @@ def main():
     )
     argp.add_argument(
         "infile",
-        nargs="?",
+        nargs="*",
         type=argparse.FileType("r", encoding="utf-8"),
-        default=sys.stdin,
-        help="the input file to read, defaults to stdin if this argument is omitted",
+        default=[sys.stdin],
+        help="the input file(s) to read, defaults to stdin if this argument is omitted",
     )
     argp.add_argument(
         "-r",
@@ -128,19 +731,69 @@ def main():
         action="store_true",
         help="instead of sorting input lines, just print a report of the size multiples that would be used",
     )
+    argp.add_argument(
+        "-b",
+        "--binary",
+        action="store_true",
+        help="process the input as raw bytes rather than utf-8 text; lines are written out unchanged, whatever their encoding",
+    )
+    argp.add_argument(
+        "-k",
+        "--key",
+        type=key_spec,
+        action="append",
+        dest="keys",
+        metavar="FIELD[h|l]",
+        help="sort by the data size in FIELD (or lexically by FIELD with an 'l' suffix) instead of the first size in the whole line; may be repeated to add tiebreak keys",
+    )
+    argp.add_argument(
+        "-t",
+        "--field-separator",
+        metavar="SEP",
+        type=field_separator,
+        help="with --key, fields are separated by SEP rather than by runs of whitespace",
+    )
+    strategy = argp.add_mutually_exclusive_group()
+    strategy.add_argument(
+        "-S",
+        "--buffer-size",
+        type=parse_buffer_size,
+        metavar="SIZE",
+        help="sort at most SIZE bytes of input (e.g. '512M') in memory at a time, spilling sorted runs to temporary files",
+    )
+    strategy.add_argument(
+        "-P",
+        "--parallel",
+        type=positive_int,
+        metavar="N",
+        help="extract sizes and sort chunks of the input in N worker processes, then merge the results",
+    )
+    strategy.add_argument(
+        "-M",
+        "--merge",
+        action="store_true",
+        help="merge input files which are each already sorted by hsort (with the same options) rather than sorting them",
+    )
+    strategy.add_argument(
+        "--top",
+        type=positive_int,
+        metavar="N",
+        help="only print the N largest lines, largest first (like '-r | head -n N' but without holding the whole input in memory)",
+    )
+    strategy.add_argument(
+        "--bottom",
+        type=positive_int,
+        metavar="N",
+        help="only print the N smallest lines, smallest first (like '| head -n N' but without holding the whole input in memory)",
+    )
     args = argp.parse_args()
 
     # figure out what byte multiples to use
-    multiples = IEC_MULTIPLES
-
-    if not args.strict:
-        multiples.update(IEC_KILO_PATCH)
-
-    if args.classic:
-        multiples.update(CLASSIC_MULTIPLES)
-
-    if args.strict_classic:
-        multiples = CLASSIC_MULTIPLES
+    multiples = build_multiples(
+        classic=args.classic,
+        strict_classic=args.strict_classic,
+        strict=args.strict,
+    )
 
     sorted_labels = sorted(multiples.keys(), key=multiples.__getitem__)
 
@@ -150,42 +803,50 @@ def main():
             sys.stdout.write("{}\t{}\n".format(label, multiples[label]))
         sys.exit(0)
 
-    # build the regex
-    # returned match groups look like this: ('98.6', 'MB') or this ('228', 'K')
-    # fmt: off
-    regex = re.compile(
-        (
-            r'\b'
-            r'(\d+(?:\.\d+)?)'
-            r'\s*'
-            r'('
-        )
-        +
-        '|'.join(sorted_labels)
-        +
-        (
-            r')'
-            r'\b'
-        )
+    if args.binary:
+        infiles = [binary_input(infile) for infile in args.infile]
+        output = sys.stdout.buffer
+        multiples = {label.encode("ascii"): value for label, value in multiples.items()}
+        separator = os.fsencode(args.field_separator) if args.field_separator else None
+    else:
+        infiles = args.infile
+        output = sys.stdout
+        separator = args.field_separator
+
+    records = functools.partial(
+        size_records,
+        multiples=multiples,
+        only_matches=args.only_matches,
+        keys=args.keys or (),
+        separator=separator,
+        binary=args.binary,
     )
-    # fmt: on
-
-    # start processing input lines
-    parsed = {}
-    for line in args.infile:
-        match = regex.search(line)
-        if not match:
-            if not args.only_matches:
-                # this just bunches non-matched lines at the beginning
-                # I think we can do better, but I don't know how yet
-                parsed[line] = 0
-            continue
 
-        size_str, multiple_str = match.groups()
-        parsed[line] = float(size_str) * multiples[multiple_str]
+    infile = itertools.chain.from_iterable(infiles)
+
+    if args.merge:
+        lines = merge_sorted(infiles, records, reverse=args.reverse)
+    elif args.top is not None or args.bottom is not None:
+        lines = select_lines(
+            infile,
+            records,
+            top=args.top,
+            bottom=args.bottom,
+            reverse=args.reverse,
+        )
+    elif args.buffer_size is not None:
+        lines = external_sort(
+            infile, records, args.buffer_size, reverse=args.reverse, binary=args.binary
+        )
+    elif args.parallel is not None:
+        lines = parallel_sort(infile, records, args.parallel, reverse=args.reverse)
+    else:
+        store = LineStore(binary=args.binary)
+        for size, line in records(infile):
+            store.append(size, line)
+        lines = store.sorted_lines(reverse=args.reverse)
 
-    for line in sorted(parsed, key=parsed.__getitem__, reverse=args.reverse):
-        sys.stdout.write(line)
+    output.writelines(lines)
 
 
 if __name__ == "__main__":
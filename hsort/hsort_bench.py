@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+micro-benchmarks for the size parsing in hsort.py; the total line count is
+reached by cycling through a smaller pool of generated "du -h"-style lines so
+that memory use stays low even for runs of tens of millions of lines
+"""
+import argparse
+import itertools
+import random
+import re
+import sys
+import time
+from typing import Callable, Dict, Iterable, List
+
+import hsort
+
+SAMPLE_LABELS = ["", "B", "K", "M", "G", "T", "KiB", "MiB", "GiB", "kB", "MB", "GB"]
+
+
+def sample_lines(count: int, seed: int = 0) -> List[str]:
+    """return count pseudo-random lines that look like du -h / docker output"""
+    rng = random.Random(seed)
+    lines = []
+    for index in range(count):
+        size = "{:.1f}".format(rng.uniform(0, 1000)).rstrip("0").rstrip(".")
+        label = rng.choice(SAMPLE_LABELS)
+        spacing = " " if rng.random() < 0.3 else ""
+        lines.append(
+            "{}{}{}\t/srv/data/project-{}/build/output-{}.tar\n".format(
+                size, spacing, label, index % 97, index
+            )
+        )
+    return lines
+
+
+def legacy_regex(multiples: Dict[str, int]) -> "re.Pattern[str]":
+    """the label alternation regex hsort.main() used to build"""
+    sorted_labels = sorted(multiples.keys(), key=multiples.__getitem__)
+    return re.compile(
+        r"\b(\d+(?:\.\d+)?)\s*(" + "|".join(sorted_labels) + r")\b"
+    )
+
+
+def bench_regex(lines: Iterable[str], multiples: Dict[str, int]) -> None:
+    """the alternation regex search on each line"""
+    regex = legacy_regex(multiples)
+    for line in lines:
+        match = regex.search(line)
+        if match:
+            size_str, multiple_str = match.groups()
+            float(size_str) * multiples[multiple_str]
+
+
+def bench_scanner(lines: Iterable[str], multiples: Dict[str, int]) -> None:
+    """hsort.find_size on each line"""
+    find_size = hsort.find_size
+    for line in lines:
+        find_size(line, multiples)
+
+
+# the size token regex as it was when hsort used float keys
+FLOAT_TOKEN_REGEX = re.compile(r"(?<!\w)(\d+(?:\.\d+)?)\s*([A-Za-z]+)\b")
+
+
+def float_size(line: str, multiples: Dict[str, int]) -> float:
+    """hsort.find_size as it was with float keys, 0 for lines without a size"""
+    match = FLOAT_TOKEN_REGEX.search(line)
+    while match is not None:
+        size_str, label = match.groups()
+        multiple = multiples.get(label)
+        if multiple is not None:
+            return float(size_str) * multiple
+        match = FLOAT_TOKEN_REGEX.search(line, match.end())
+    return 0
+
+
+def int_size(line: str, multiples: Dict[str, int]) -> int:
+    """hsort.find_size with exact integer keys in thousandths of a byte"""
+    return hsort.find_size(line, multiples) or 0
+
+
+def bench_keys(
+    lines: Iterable[str],
+    multiples: Dict[str, int],
+    size_func: Callable[[str, Dict[str, int]], object],
+    batch_size: int = 100_000,
+) -> None:
+    """extract sort keys with size_func and sort them, batch_size at a time"""
+    lines = iter(lines)
+    while batch := list(itertools.islice(lines, batch_size)):
+        sorted([size_func(line, multiples) for line in batch])
+
+
+def bench_float_keys(lines: Iterable[str], multiples: Dict[str, int]) -> None:
+    """parse float keys and sort them"""
+    bench_keys(lines, multiples, float_size)
+
+
+def bench_int_keys(lines: Iterable[str], multiples: Dict[str, int]) -> None:
+    """parse exact integer keys with hsort.find_size and sort them"""
+    bench_keys(lines, multiples, int_size)
+
+
+BENCHMARKS: Dict[str, Callable[[Iterable[str], Dict[str, int]], None]] = {
+    "regex": bench_regex,
+    "scanner": bench_scanner,
+    "float-keys": bench_float_keys,
+    "int-keys": bench_int_keys,
+}
+
+
+def main() -> int:
+    """
+    entrypoint for direct execution; returns an integer suitable for use with sys.exit
+    """
+    argp = argparse.ArgumentParser(description="benchmark hsort size parsing")
+    argp.add_argument(
+        "-n",
+        "--lines",
+        type=int,
+        default=10_000_000,
+        help="the total number of lines to parse per benchmark",
+    )
+    argp.add_argument(
+        "--pool",
+        type=int,
+        default=100_000,
+        help="the number of distinct generated lines to cycle through",
+    )
+    argp.add_argument(
+        "-b",
+        "--benchmark",
+        action="append",
+        choices=list(BENCHMARKS),
+        help="a benchmark to run, may be given more than once; defaults to all of them",
+    )
+    args = argp.parse_args()
+
+    multiples = hsort.build_multiples()
+    pool = sample_lines(args.pool)
+
+    print("{:<12} {:>10} {:>14}".format("BENCHMARK", "SECONDS", "LINES/SECOND"))
+    for name in args.benchmark or BENCHMARKS:
+        lines = itertools.islice(itertools.cycle(pool), args.lines)
+        start = time.perf_counter()
+        BENCHMARKS[name](lines, multiples)
+        elapsed = time.perf_counter() - start
+        print("{:<12} {:>10.2f} {:>14,.0f}".format(name, elapsed, args.lines / elapsed))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
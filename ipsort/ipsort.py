@@ -1,30 +1,531 @@
 #!/usr/bin/env python3
 import argparse
+import itertools
+import mmap
+import os
 import re
 import socket
-import struct
 import sys
+from array import array
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-IP_REGEX = re.compile(r"\b(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\b")
+# address families, IPv4 addresses sort before IPv6 ones
+FAMILY_IPV4 = 4
+FAMILY_IPV6 = 6
 
+# the number of bits in an address of each family
+ADDRESS_BITS = {FAMILY_IPV4: 32, FAMILY_IPV6: 128}
 
-def ip2long(ip):
+# the sort key of lines without an address, which sort first
+NO_ADDRESS = -1
+
+LOW_64_BITS = (1 << 64) - 1
+
+# a dotted-decimal IPv4 address; the octets are validated by the pattern, so
+# out of range octets (999.1.1.1) and octets with leading zeros (which would
+# be ambiguous, inet_aton reads them as octal) don't match
+IPV4_OCTET = r"(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])"
+IPV4_PATTERN = r"\.".join([IPV4_OCTET] * 4)
+IPV4_REGEX = re.compile(r"\b" + IPV4_PATTERN + r"\b", re.ASCII)
+
+# a dotted IPv4 or a colon-separated IPv6 address (which may end in a dotted
+# IPv4 address, like ::ffff:192.0.2.1), optionally with a CIDR prefix length.
+# the IPv6 pattern is loose, candidates are validated with socket.inet_pton
+IP_REGEX = re.compile(
+    # fmt: off
+    r"(?:"
+        r"\b(?P<ipv4>" + IPV4_PATTERN + r")\b"
+    r"|"
+        r"(?<![\w:])"
+        # at least one hex digit, so a bare "::" isn't taken for an address,
+        # unless it is a network like the default route ::/0
+        r"(?=:*[0-9A-Fa-f]|::/\d)"
+        r"(?P<ipv6>"
+            r"(?:[0-9A-Fa-f]{0,4}:){2,7}"
+            r"(?:" + IPV4_PATTERN + r"|[0-9A-Fa-f]{1,4})?"
+        r")"
+        r"(?![\w:])"
+    r")"
+    r"(?:/(?P<prefix>\d{1,3})\b)?",
+    # fmt: on
+    re.ASCII,
+)
+# IP_REGEX for searching raw bytes, e.g. of a memory-mapped file
+IP_BYTES_REGEX = re.compile(IP_REGEX.pattern.encode("ascii"), re.ASCII)
+
+# the --count-by-prefix prefix lengths of each family when only one is given
+DEFAULT_COUNT_PREFIXES = {FAMILY_IPV4: 24, FAMILY_IPV6: 64}
+
+# a port number right after an address, like 192.0.2.1:443, [2001:db8::1]:443
+# or tcpdump's 192.0.2.1.443
+PORT_REGEX = re.compile(r"\]?[:.](\d{1,5})\b", re.ASCII)
+
+# the first decimal integer in a --key field
+NUMBER_REGEX = re.compile(r"\d+", re.ASCII)
+
+# the largest value of a numeric --key, larger numbers are clamped to it
+MAX_NUMBER = (1 << 64) - 1
+
+# the number of low bits of the --mmap sort keys which hold the line number
+MMAP_INDEX_BITS = 40
+
+# the maximum number of buffers written by each os.writev call
+WRITEV_BATCH = 1024
+
+
+def ipv4_keys(lines: Iterable[str], default: Optional[int] = None) -> "array[int]":
+    """
+    return the 32-bit integer value of the first IPv4 address in each of the
+    given lines, as an array('I') taking 4 bytes per line. lines without an
+    IPv4 address get the default, or raise ValueError if there is no default
+    """
+    keys = array("I")
+    append = keys.append
+    search = IPV4_REGEX.search
+    inet_aton = socket.inet_aton
+    from_bytes = int.from_bytes
+    for line in lines:
+        match = search(line)
+        if match is not None:
+            append(from_bytes(inet_aton(match.group()), "big"))
+        elif default is not None:
+            append(default)
+        else:
+            raise ValueError("no IPv4 address in line: {!r}".format(line))
+    return keys
+
+
+def pack_key(family: int, address: int, length: int) -> int:
+    """
+    pack an address family, address and prefix length into a single integer
+    which sorts like the (family, address, length) tuple, so that sorting
+    compares one int per line rather than tuples
+    """
+    return (family << 128 | address) << 8 | length
+
+
+def unpack_key(key: int) -> Tuple[int, int, int]:
+    """return the (family, address, prefix length) packed into a key"""
+    return key >> 136, (key >> 8) & ((1 << 128) - 1), key & 0xFF
+
+
+def format_network(family: int, address: int, length: int) -> str:
+    """return a network in CIDR notation, like 10.0.0.0/8 or ::1/128"""
+    if family == FAMILY_IPV4:
+        text = socket.inet_ntoa(address.to_bytes(4, "big"))
+    else:
+        text = socket.inet_ntop(socket.AF_INET6, address.to_bytes(16, "big"))
+    return "{}/{}".format(text, length)
+
+
+def find_address(
+    x: Union[str, bytes, mmap.mmap], start: int = 0, end: int = sys.maxsize
+) -> Tuple[int, int]:
+    """
+    returns the packed (family, address, prefix length) of the first IPv4 or
+    IPv6 address or CIDR network in the given value and the offset just past
+    it, or (NO_ADDRESS, -1) if it has none. addresses without a prefix length
+    get that of a single host, so a network sorts before the hosts in it. the
+    value may also be raw bytes, like a memory-mapped file, which is searched
+    between the start and end offsets; only the address found is decoded.
+    this is called once per line, so it is written for speed rather than reuse
+    """
+    binary = not isinstance(x, str)
+    search = IP_BYTES_REGEX.search if binary else IP_REGEX.search
+    match = search(x, start, end)
+    while match is not None:
+        ipv4, ipv6, prefix = match.group("ipv4", "ipv6", "prefix")
+        if ipv4 is not None:
+            # IPV4_PATTERN only matches valid addresses
+            family, bits = FAMILY_IPV4, 32
+            if binary:
+                ipv4 = ipv4.decode("ascii")
+            address = int.from_bytes(socket.inet_aton(ipv4), "big")
+        else:
+            family, bits = FAMILY_IPV6, 128
+            if binary:
+                ipv6 = ipv6.decode("ascii")
+            try:
+                address = int.from_bytes(socket.inet_pton(socket.AF_INET6, ipv6), "big")
+            except OSError:
+                address = -1
+        length = bits if prefix is None else int(prefix)
+        if address >= 0 and length <= bits:
+            return pack_key(family, address, length), match.end()
+        match = search(x, match.end(), end)
+    return NO_ADDRESS, -1
+
+
+def ip_key(
+    x: Union[str, bytes, mmap.mmap], start: int = 0, end: int = sys.maxsize
+) -> int:
+    """
+    returns the sorting key to use for the given value: the find_address key
+    of its first address or network, or NO_ADDRESS if it has none
+    """
+    return find_address(x, start, end)[0]
+
+
+class KeySpec(NamedTuple):
+    """a --key definition: a 1-based field number and the kind of key in it"""
+
+    field: int
+    kind: str  # "i" for an address, "p" for the port after it, "n" for a number
+
+
+def address_field_key(field: str) -> int:
+    """the ip_key of a --key field, plus one so that it is never negative"""
+    return ip_key(field) + 1
+
+
+def port_field_key(field: str) -> int:
+    """
+    the port number after the first address in a --key field (the one its
+    address key is taken from) plus one, or 0 if there is no address or it
+    isn't followed by a valid port
+    """
+    _, offset = find_address(field)
+    if offset < 0:
+        return 0
+    port = PORT_REGEX.match(field, offset)
+    if port is None or int(port.group(1)) > 0xFFFF:
+        return 0
+    return int(port.group(1)) + 1
+
+
+def number_field_key(field: str) -> int:
+    """
+    the first integer in a --key field (clamped to MAX_NUMBER) plus one, or 0
+    if there is none
+    """
+    match = NUMBER_REGEX.search(field)
+    if match is None:
+        return 0
+    return min(int(match.group()), MAX_NUMBER) + 1
+
+
+# the key function of each kind of --key, and the number of bits its keys use
+FIELD_KEYS: Dict[str, Tuple[Callable[[str], int], int]] = {
+    "i": (
+        address_field_key,
+        (pack_key(FAMILY_IPV6, (1 << 128) - 1, 128) + 1).bit_length(),
+    ),
+    "p": (port_field_key, (0xFFFF + 1).bit_length()),
+    "n": (number_field_key, (MAX_NUMBER + 1).bit_length()),
+}
+
+
+def composite_key(
+    keys: Sequence[KeySpec], separator: Optional[str] = None
+) -> Callable[[str], int]:
+    """
+    return a sort key function for lines which splits them into fields on
+    separator (or on runs of whitespace if it is None) and packs the keys of
+    the selected fields into a single integer, each in a fixed number of bits,
+    so that it sorts like the tuple of field keys but compares as one int.
+    missing fields, and fields without the kind of key asked for, sort first
+    """
+    maxsplit = max(spec.field for spec in keys)
+    parts = [(spec.field - 1,) + FIELD_KEYS[spec.kind] for spec in keys]
+
+    def key(line: str) -> int:
+        fields = line.split(separator, maxsplit)
+        count = len(fields)
+        packed = 0
+        for index, field_key, bits in parts:
+            packed = packed << bits | field_key(fields[index] if index < count else "")
+        return packed
+
+    return key
+
+
+def writev_all(fd: int, buffers: List[Union[bytes, memoryview]]) -> None:
+    """os.writev the buffers to a file descriptor, finishing short writes"""
+    written = os.writev(fd, buffers)
+    for buffer in buffers:
+        if written >= len(buffer):
+            written -= len(buffer)
+            continue
+        view = memoryview(buffer)[written:]
+        written = 0
+        while view:
+            view = view[os.write(fd, view) :]
+
+
+def mmap_sort(mapping: mmap.mmap, fd: int) -> None:
+    """
+    sort the lines of a memory-mapped file by ip_key and write them to a file
+    descriptor. the lines are scanned in place, and written straight from the
+    mapping with os.writev, so they are never decoded or copied. only one
+    integer per line is kept: its key (plus one, so lines without an address
+    are 0) packed with its line number, which also keeps the sort stable
+    """
+    find = mapping.find
+    size = len(mapping)
+    offsets = array("Q", [0])
+    records = []
+    index = 0
+    start = 0
+    while start < size:
+        # the end of the line, including its newline if it has one
+        end = find(b"\n", start) + 1 or size
+        records.append((ip_key(mapping, start, end) + 1) << MMAP_INDEX_BITS | index)
+        offsets.append(end)
+        start = end
+        index += 1
+    records.sort()
+
+    # a last line without a newline is the only one which gets copied
+    last = index - 1 if mapping[-1:] != b"\n" else -1
+    index_mask = (1 << MMAP_INDEX_BITS) - 1
+    view = memoryview(mapping)
+    for batch_start in range(0, len(records), WRITEV_BATCH):
+        batch = []
+        for record in records[batch_start : batch_start + WRITEV_BATCH]:
+            index = record & index_mask
+            line = view[offsets[index] : offsets[index + 1]]
+            batch.append(line if index != last else bytes(line) + b"\n")
+        writev_all(fd, batch)
+        del batch, line
+    view.release()
+
+
+class PrefixTrie:
+    """
+    a path-compressed binary (Patricia) trie of networks of one address
+    family, which collapses them into the fewest networks covering the same
+    addresses. nodes are kept in parallel arrays rather than as objects: the
+    network (as two 64-bit halves), prefix length, left and right child node
+    numbers, and whether every address under the node was inserted. node 0 is
+    the root, and child number 0 means no child. a covered node's subtree is
+    dropped, so there are at most two nodes per inserted network
+    """
+
+    def __init__(self, bits: int) -> None:
+        self.bits = bits
+        self.high = array("Q", [0])
+        self.low = array("Q", [0])
+        self.lengths = array("B", [0])
+        self.children = (array("I", [0]), array("I", [0]))
+        self.covered = array("B", [0])
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def network(self, node: int) -> int:
+        """return the network address of a node"""
+        return self.high[node] << 64 | self.low[node]
+
+    def add_node(self, network: int, length: int, covered: bool) -> int:
+        """add a node without children and return its number"""
+        self.high.append(network >> 64)
+        self.low.append(network & LOW_64_BITS)
+        self.lengths.append(length)
+        self.children[0].append(0)
+        self.children[1].append(0)
+        self.covered.append(covered)
+        return len(self.lengths) - 1
+
+    def insert(self, network: int, length: int) -> None:
+        """add a network, whose host bits must be zero"""
+        bits = self.bits
+        lengths = self.lengths
+        covered = self.covered
+        children = self.children
+
+        # as usual for a Patricia trie, walk down by the bits of the network
+        # alone, and only then compare it with the network of the node found
+        path = [0]
+        node = 0
+        while not covered[node] and lengths[node] < length:
+            child = children[(network >> (bits - 1 - lengths[node])) & 1][node]
+            if not child or lengths[child] > length:
+                break
+            node = child
+            path.append(node)
+        common = bits - (self.network(node) ^ network).bit_length()
+
+        # back up to the deepest node whose network contains the new one,
+        # nodes' networks always contain those of their descendants
+        while lengths[path[-1]] > common:
+            path.pop()
+        node = path[-1]
+        if covered[node]:
+            return
+        if lengths[node] == length:
+            covered[node] = True
+            children[0][node] = children[1][node] = 0
+            return
+
+        side = children[(network >> (bits - 1 - lengths[node])) & 1]
+        child = side[node]
+        if not child:
+            side[node] = self.add_node(network, length, True)
+            return
+        common = bits - (self.network(child) ^ network).bit_length()
+        if common >= length:
+            # the new network covers the child's
+            side[node] = self.add_node(network, length, True)
+            return
+        # the networks diverge above the child, branch where they do
+        host_bits = bits - common
+        branch = self.add_node(network >> host_bits << host_bits, common, False)
+        leaf = self.add_node(network, length, True)
+        children[(network >> (host_bits - 1)) & 1][branch] = leaf
+        children[1 - ((network >> (host_bits - 1)) & 1)][branch] = child
+        side[node] = branch
+
+    def networks(self) -> Iterator[Tuple[int, int]]:
+        """
+        generate the (network, prefix length) of the fewest networks covering
+        exactly the inserted ones, in order. adjacent networks which make up
+        a bigger network, like 10.0.0.0/25 and 10.0.0.128/25, are merged
+        """
+        left, right = self.children
+        lengths = self.lengths
+        covered = self.covered
+
+        # children come after their parents in preorder, so merging in
+        # reverse preorder lets merged siblings merge with their own sibling
+        preorder = array("I")
+        stack = array("I", [0])
+        while stack:
+            node = stack.pop()
+            preorder.append(node)
+            if not covered[node]:
+                stack.extend(child for child in (right[node], left[node]) if child)
+        for node in reversed(preorder):
+            if (
+                left[node]
+                and right[node]
+                and covered[left[node]]
+                and covered[right[node]]
+                and lengths[left[node]] == lengths[right[node]] == lengths[node] + 1
+            ):
+                covered[node] = True
+        del preorder
+
+        stack = array("I", [0])
+        while stack:
+            node = stack.pop()
+            if covered[node]:
+                yield self.network(node), lengths[node]
+            else:
+                stack.extend(child for child in (right[node], left[node]) if child)
+
+
+def aggregate(lines: Iterable[str]) -> Iterator[str]:
+    """
+    generate the fewest CIDR networks covering exactly the addresses and
+    networks found in the given lines, IPv4 first and then IPv6, in order
+    """
+    tries: Dict[int, PrefixTrie] = {}
+    for line in lines:
+        key = ip_key(line)
+        if key == NO_ADDRESS:
+            continue
+        family, address, length = unpack_key(key)
+        trie = tries.get(family)
+        if trie is None:
+            trie = tries[family] = PrefixTrie(ADDRESS_BITS[family])
+        host_bits = trie.bits - length
+        trie.insert(address >> host_bits << host_bits, length)
+    for family in sorted(tries):
+        for network, length in tries[family].networks():
+            yield format_network(family, network, length) + "\n"
+
+
+def count_by_prefix(
+    lines: Iterable[str], prefixes: Dict[int, int]
+) -> Iterator[str]:
     """
-    Convert an IP string to long
-    https://stackoverflow.com/a/9591005
+    generate "count network" lines, like uniq -c, with the number of the given
+    lines in each network of the prefix length of its family, in order. the
+    lines are streamed and only one count per distinct network is kept.
+    networks already shorter than the prefix length are counted as they are
     """
-    packedIP = socket.inet_aton(ip)
-    return struct.unpack("!L", packedIP)[0]
+    counts: Dict[int, int] = {}
+    get = counts.get
+    for line in lines:
+        key = ip_key(line)
+        if key == NO_ADDRESS:
+            continue
+        family, address, length = unpack_key(key)
+        length = min(length, prefixes[family])
+        host_bits = ADDRESS_BITS[family] - length
+        key = pack_key(family, address >> host_bits << host_bits, length)
+        counts[key] = get(key, 0) + 1
+    for key in sorted(counts):
+        yield "{:>7} {}\n".format(counts[key], format_network(*unpack_key(key)))
 
 
-def ip_key(x):
+def unique_lines(
+    lines: Iterable[str], key: Callable[[str], int] = ip_key
+) -> Iterator[str]:
     """
-    returns the sorting key to use for the given value
+    generate the first of the given lines with each address (and prefix
+    length), or each key if a key function is given, sorted; only the kept
+    lines are held in memory
     """
-    match = IP_REGEX.search(x)
+    unique: Dict[int, str] = {}
+    for line in lines:
+        unique.setdefault(key(line), line)
+    for key in sorted(unique):
+        yield unique[key]
+
+
+def key_spec(value: str) -> KeySpec:
+    """
+    argparse type for --key definitions: a field number optionally followed by
+    'i' (the address in the field, the default), 'p' (the port after the
+    address) or 'n' (the first number in the field)
+    """
+    match = re.fullmatch(r"([1-9]\d*)([inp]?)", value.strip())
     if not match:
-        return -1
-    return ip2long(match.group(1))
+        raise argparse.ArgumentTypeError(
+            "invalid key definition: {!r}".format(value)
+        )
+    return KeySpec(int(match.group(1)), match.group(2) or "i")
+
+
+def field_separator(value: str) -> str:
+    """argparse type for --field-separator, which can't be empty"""
+    if not value:
+        raise argparse.ArgumentTypeError("the field separator can't be empty")
+    return value
+
+
+def prefix_lengths(value: str) -> Dict[int, int]:
+    """
+    argparse type for --count-by-prefix: an IPv4 and an IPv6 prefix length,
+    like /24,/64. a single length up to 32 sets the IPv4 one and a longer
+    one the IPv6 one, and the other family keeps its default
+    """
+    lengths = re.fullmatch(r"/?(\d{1,3})(?:,/?(\d{1,3}))?", value.strip())
+    if lengths is None:
+        raise argparse.ArgumentTypeError("invalid prefix length: {!r}".format(value))
+    prefixes = dict(DEFAULT_COUNT_PREFIXES)
+    if lengths.group(2) is not None:
+        prefixes[FAMILY_IPV4] = int(lengths.group(1))
+        prefixes[FAMILY_IPV6] = int(lengths.group(2))
+    elif int(lengths.group(1)) <= ADDRESS_BITS[FAMILY_IPV4]:
+        prefixes[FAMILY_IPV4] = int(lengths.group(1))
+    else:
+        prefixes[FAMILY_IPV6] = int(lengths.group(1))
+    if any(length > ADDRESS_BITS[family] for family, length in prefixes.items()):
+        raise argparse.ArgumentTypeError("invalid prefix length: {!r}".format(value))
+    return prefixes
 
 
 def main() -> int:
@@ -32,7 +533,7 @@ def main() -> int:
     entrypoint for direct execution; returns an integer suitable for use with sys.exit
     """
     argp = argparse.ArgumentParser(
-        description=("utility for sorting input lines by IPv4 address")
+        description=("utility for sorting input lines by IPv4 or IPv6 address")
     )
     argp.add_argument(
         "--debug",
@@ -46,11 +547,91 @@ def main() -> int:
         nargs="*",
         help="file(s) whose lines should be read, sorted, and printed",
     )
+    argp.add_argument(
+        "-k",
+        "--key",
+        type=key_spec,
+        action="append",
+        dest="keys",
+        metavar="FIELD[i|p|n]",
+        help="sort by the address in FIELD (or by the port after it with a 'p' suffix, or by the first number in it with an 'n' suffix) instead of the first address in the whole line; may be repeated to add tiebreak keys",
+    )
+    argp.add_argument(
+        "-t",
+        "--field-separator",
+        metavar="SEP",
+        type=field_separator,
+        help="with --key, fields are separated by SEP rather than by runs of whitespace",
+    )
+    argp.add_argument(
+        "-T",
+        "--tiebreak",
+        action="store_true",
+        help="order lines with equal keys by their whole text, like sort(1) does without -s, rather than keeping their input order",
+    )
+    mode = argp.add_mutually_exclusive_group()
+    mode.add_argument(
+        "-a",
+        "--aggregate",
+        action="store_true",
+        help="instead of the lines, print the fewest CIDR networks which cover exactly the addresses and networks of all inputs, in order",
+    )
+    mode.add_argument(
+        "-c",
+        "--count-by-prefix",
+        type=prefix_lengths,
+        metavar="/V4[,/V6]",
+        help="instead of the lines, print the number of addresses in each network of the given prefix length (/24 for IPv4 and /64 for IPv6 by default), in order; the lines aren't kept in memory",
+    )
+    mode.add_argument(
+        "-u",
+        "--unique",
+        action="store_true",
+        help="only print the first line with each address (and prefix length)",
+    )
+    mode.add_argument(
+        "-M",
+        "--mmap",
+        action="store_true",
+        help="memory-map input files and sort their raw bytes, without decoding or copying lines; inputs which can't be mapped, like pipes, are sorted as usual",
+    )
     args = argp.parse_args()
+    if (args.keys or args.tiebreak) and (
+        args.aggregate or args.count_by_prefix or args.mmap
+    ):
+        argp.error(
+            "--key and --tiebreak can't be used with"
+            " --aggregate, --count-by-prefix or --mmap"
+        )
+    key = composite_key(args.keys, args.field_separator) if args.keys else ip_key
+
+    if args.aggregate:
+        sys.stdout.writelines(aggregate(itertools.chain.from_iterable(args.input)))
+        return 0
+
+    if args.count_by_prefix:
+        lines = itertools.chain.from_iterable(args.input)
+        sys.stdout.writelines(count_by_prefix(lines, args.count_by_prefix))
+        return 0
 
     for file in args.input:
-        for line in sorted(file, key=ip_key):
-            print(line, end="")
+        if args.mmap:
+            try:
+                mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # pipes and empty files can't be mapped
+                pass
+            else:
+                sys.stdout.flush()
+                mmap_sort(mapping, sys.stdout.fileno())
+                mapping.close()
+                continue
+        # sorting by the text first and then (stably) by the key orders lines
+        # like sorting on (key, line) tuples would, without building them
+        lines = sorted(file) if args.tiebreak else file
+        lines = unique_lines(lines, key) if args.unique else sorted(lines, key=key)
+        for line in lines:
+            print(line, end="" if line.endswith("\n") else "\n")
 
     return 0
 
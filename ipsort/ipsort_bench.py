@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+micro-benchmarks for the address parsing in ipsort.py; the total line count
+is reached by cycling through a smaller pool of generated access log lines so
+that memory use stays low even for runs of tens of millions of lines
+"""
+import argparse
+import itertools
+import random
+import re
+import socket
+import struct
+import sys
+import time
+from typing import Callable, Dict, Iterable, List
+
+import ipsort
+
+SAMPLE_REQUESTS = [
+    "GET / HTTP/1.1",
+    "GET /index.html HTTP/1.1",
+    "GET /static/app.3.2.1.js HTTP/1.1",
+    "POST /api/v1/login HTTP/1.1",
+    "GET /favicon.ico HTTP/2.0",
+]
+
+
+def sample_lines(count: int, seed: int = 0) -> List[str]:
+    """return count pseudo-random lines that look like an nginx access log"""
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        lines.append(
+            '{}.{}.{}.{} - - [18/Oct/2026:{:02}:{:02}:{:02} +0000] "{}" {} {} "-" '
+            '"Mozilla/5.0 (X11; Linux x86_64)"\n'.format(
+                rng.randrange(1, 224),
+                rng.randrange(256),
+                rng.randrange(256),
+                rng.randrange(256),
+                rng.randrange(24),
+                rng.randrange(60),
+                rng.randrange(60),
+                rng.choice(SAMPLE_REQUESTS),
+                rng.choice([200, 200, 200, 304, 404]),
+                rng.randrange(100_000),
+            )
+        )
+    return lines
+
+
+# ipsort.IP_REGEX as it was before IPv6 support
+LEGACY_IP_REGEX = re.compile(r"\b(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\b")
+
+
+def ip2long(ip: str) -> int:
+    """the IPv4 address conversion ipsort used to have"""
+    return struct.unpack("!L", socket.inet_aton(ip))[0]
+
+
+def legacy_ip_key(line: str) -> int:
+    """ipsort.ip_key as it was, with socket.inet_aton and struct.unpack"""
+    match = LEGACY_IP_REGEX.search(line)
+    if not match:
+        return -1
+    return ip2long(match.group(1))
+
+
+def bench_inet_aton(lines: Iterable[str]) -> None:
+    """the legacy ip_key on each line"""
+    for line in lines:
+        legacy_ip_key(line)
+
+
+def bench_ip_key(lines: Iterable[str]) -> None:
+    """ipsort.ip_key on each line, which also looks for IPv6 and CIDRs"""
+    ip_key = ipsort.ip_key
+    for line in lines:
+        ip_key(line)
+
+
+def bench_ipv4_keys(lines: Iterable[str], batch_size: int = 100_000) -> None:
+    """ipsort.ipv4_keys on batch_size lines at a time"""
+    lines = iter(lines)
+    while batch := list(itertools.islice(lines, batch_size)):
+        ipsort.ipv4_keys(batch)
+
+
+BENCHMARKS: Dict[str, Callable[[Iterable[str]], None]] = {
+    "inet_aton": bench_inet_aton,
+    "ip_key": bench_ip_key,
+    "ipv4_keys": bench_ipv4_keys,
+}
+
+
+def main() -> int:
+    """
+    entrypoint for direct execution; returns an integer suitable for use with sys.exit
+    """
+    argp = argparse.ArgumentParser(description="benchmark ipsort address parsing")
+    argp.add_argument(
+        "-n",
+        "--lines",
+        type=int,
+        default=10_000_000,
+        help="the total number of lines to parse per benchmark",
+    )
+    argp.add_argument(
+        "--pool",
+        type=int,
+        default=100_000,
+        help="the number of distinct generated lines to cycle through",
+    )
+    argp.add_argument(
+        "-b",
+        "--benchmark",
+        action="append",
+        choices=list(BENCHMARKS),
+        help="a benchmark to run, may be given more than once; defaults to all of them",
+    )
+    args = argp.parse_args()
+
+    pool = sample_lines(args.pool)
+
+    print("{:<12} {:>10} {:>14}".format("BENCHMARK", "SECONDS", "LINES/SECOND"))
+    for name in args.benchmark or BENCHMARKS:
+        lines = itertools.islice(itertools.cycle(pool), args.lines)
+        start = time.perf_counter()
+        BENCHMARKS[name](lines)
+        elapsed = time.perf_counter() - start
+        print("{:<12} {:>10.2f} {:>14,.0f}".format(name, elapsed, args.lines / elapsed))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
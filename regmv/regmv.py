@@ -5,12 +5,29 @@ regmv: use regular expressions to rename files
 import argparse
 import datetime
 import functools
+import itertools
+import operator
+import os
 import pathlib
 import re
 import shlex
 import string
 import sys
-from typing import Callable, Dict, List, Optional, Union
+from typing import (
+    Callable,
+    Container,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+# the default number of renames to review and perform at a time with --recursive
+DEFAULT_BATCH_SIZE = 1000
 
 
 class Counter:
@@ -114,9 +131,13 @@ class StringWrap:
 class Rename:
     """class representing a rename operation"""
 
-    def __init__(self, path: pathlib.Path, new_name: str) -> None:
+    def __init__(
+        self, path: pathlib.Path, new_name: str, checked: bool = False
+    ) -> None:
         self.old = path
         self.new = path.parent.joinpath(new_name)
+        # whether the destination is already known to be free (see plan_directory)
+        self.checked = checked
 
     def perform(
         self,
@@ -135,8 +156,9 @@ class Rename:
             if not dry_run:
                 self.old.replace(self.new)
             return
-        # when not forcing we do a .exists check before anything
-        if self.new.exists():
+        # when not forcing we do a .exists check before anything, unless the
+        # rename was planned with the listing of its directory
+        if not self.checked and self.new.exists():
             warn("{!s}: destination already exists".format(self))
             return
         vprint(str(self))
@@ -147,6 +169,250 @@ class Rename:
         return "mv {} {}".format(shlex.quote(str(self.old)), shlex.quote(str(self.new)))
 
 
+def walk(
+    top: Union[str, pathlib.Path]
+) -> Iterator[Tuple[pathlib.Path, List[os.DirEntry]]]:
+    """
+    generate a (directory, entries) tuple for the top directory and every
+    directory under it, with the entries of each listed by a single os.scandir
+    call and sorted by name. like os.walk(topdown=False), subdirectories come
+    before the directory containing them, so renaming the entries of one
+    never moves a directory which is still to come. symlinks to directories
+    aren't followed, and unreadable directories are skipped
+    """
+    try:
+        with os.scandir(top) as iterator:
+            entries = sorted(iterator, key=operator.attrgetter("name"))
+    except OSError as err:
+        warn("{}: {}".format(top, err.strerror))
+        return
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir(follow_symlinks=False)
+        except OSError:
+            is_dir = False
+        if is_dir:
+            yield from walk(entry.path)
+    yield pathlib.Path(top), entries
+
+
+def plain_name(name: str) -> bool:
+    """return True if name is a file name in its directory, not a path"""
+    if name in (os.curdir, os.pardir) or os.sep in name:
+        return False
+    return os.altsep is None or os.altsep not in name
+
+
+def real_path(path: pathlib.Path) -> str:
+    """
+    return the absolute, normalized form of a path, resolving symlinks in
+    the directories leading to it but not in the path itself
+    """
+    return os.path.normpath(os.path.join(os.path.realpath(path.parent), path.name))
+
+
+def temporary_name(taken: Container[str]) -> str:
+    """return a hidden file name which isn't in taken, to move a file aside"""
+    for number in itertools.count():
+        name = ".regmv-{}-{}".format(os.getpid(), number)
+        if name not in taken:
+            return name
+    raise AssertionError("unreachable")
+
+
+def plan_directory(
+    directory: pathlib.Path,
+    renames: Dict[str, str],
+    existing: Set[str],
+    force: bool = False,
+) -> Iterator[List[Rename]]:
+    """
+    generate the given renames (a mapping of old to new names) of files in a
+    directory in an order which is safe to perform, given the set of names
+    which exist in the directory. each item is a list of renames which must be
+    performed together, in order:
+
+    - renames to a destination which an earlier rename also has are skipped
+    - renames to an existing name are skipped, unless that file is renamed
+      too or force is True (then the existing file is overwritten)
+    - chains, like a->b and b->c, are ordered so that b->c comes first
+    - cycles, like a->b and b->a, are resolved by moving a file to a temporary
+      name first: a->tmp, b->a, tmp->b
+
+    the renames are checked against the names in the directory listing, so
+    they don't need to stat their destinations when performed, except those
+    to a name which only differs in case from an existing one, or which isn't
+    a plain name in the directory
+    """
+    # the kept renames, both ways around
+    targets: Dict[str, str] = {}
+    sources: Dict[str, str] = {}
+    for old, new in renames.items():
+        if old in existing and new not in targets:
+            targets[new] = old
+            sources[old] = new
+        elif old not in existing:
+            warn("{!s}: no such file".format(Rename(directory / old, new)))
+        else:
+            warn(
+                "{!s}: destination is also the destination of {}".format(
+                    Rename(directory / old, new),
+                    shlex.quote(str(directory / targets[new])),
+                )
+            )
+
+    # follow each chain of renames to its end: a name which doesn't exist
+    # (so the chain can be performed), or which exists and isn't renamed (so
+    # none of the chain can be), or back around to its start (a cycle)
+    possible: Dict[str, bool] = {}
+    for start in sources:
+        chain: Dict[str, None] = {}  # an ordered set, for long chains
+        name = start
+        while name in sources and name not in possible and name not in chain:
+            chain[name] = None
+            name = sources[name]
+        if name in possible:
+            result = possible[name]
+        else:
+            result = force or name in chain or name not in existing
+        for name in chain:
+            possible[name] = result
+            if not result:
+                warn(
+                    "{!s}: destination already exists".format(
+                        Rename(directory / name, sources[name])
+                    )
+                )
+
+    # on a case-insensitive filesystem a name may exist in another case which
+    # the listing doesn't match, so renames to such names are still checked
+    folded = {name.casefold() for name in existing}
+
+    def step(name: str, first: str = "") -> List[Rename]:
+        """the renames into name and backwards along its chain, until first"""
+        operations = []
+        while name in targets and targets[name] != first:
+            name, new = targets[name], name
+            checked = new in existing or new.casefold() not in folded
+            checked = checked or new.casefold() == name.casefold()
+            # a new name with a path separator (or . or ..) leaves the directory
+            checked = checked and plain_name(new)
+            operations.append(Rename(directory / name, new, checked=checked))
+            possible[name] = False
+        return operations
+
+    # chains end with a rename to a free name, perform them from there
+    for old, new in sources.items():
+        if possible[old] and new not in sources:
+            yield step(new)
+
+    # whatever is left is a cycle, move one file aside to start it. cycles
+    # are performed one after another, so they can share a temporary name
+    aside = temporary_name(existing.union(targets))
+    for old in sources:
+        if possible[old]:
+            possible[old] = False
+            yield [
+                Rename(directory / old, aside, checked=True),
+                *step(old, old),
+                Rename(directory / aside, sources[old], checked=True),
+            ]
+
+
+def plan_renames(
+    paths: Iterable[pathlib.Path],
+    search: re.Pattern,
+    replace: Callable[[re.Match], str],
+    maxreplace: int = 0,
+    recursive: bool = False,
+    force: bool = False,
+    verbose: bool = False,
+) -> Iterator[List[Rename]]:
+    """
+    generate the renames of the given paths whose name is changed by the
+    search regex and replace function, as lists of renames which must be
+    performed together and in order. if recursive is True, the contents of
+    the directories among the paths are walked and renamed first; the regex
+    is applied to the name of each DirEntry as it is reached, and paths inside
+    a walked directory are left to the walk. the renames are planned with
+    plan_directory a directory at a time, since renames never leave their
+    directory, with the names in each taken from a single listing of it
+    rather than a stat per rename. if the verbose argument is True, print the
+    paths which are skipped
+    """
+    vprint = functools.partial(cond_print, enable=verbose)
+
+    def changes(directory: pathlib.Path, names: Iterable[str]) -> Dict[str, str]:
+        """map each of the names which the replacement changes to its new name"""
+        renames: Dict[str, str] = {}
+        for name in names:
+            new_name, match_count = search.subn(replace, name, maxreplace)
+            if not match_count:
+                vprint("non-match " + str(directory / name))
+            elif new_name == name:
+                vprint("unchanged " + str(directory / name))
+            else:
+                renames[name] = new_name
+        return renames
+
+    paths = list(paths)
+    roots: Set[str] = set()
+    if recursive:
+        roots = {
+            real_path(path)
+            for path in paths
+            if path.is_dir() and not path.is_symlink()
+        }
+    walked: Set[str] = set()
+
+    # the new names of the paths themselves are worked out in order (for the
+    # counter), but they are planned last, grouped by their directories
+    groups: Dict[pathlib.Path, Dict[str, str]] = {}
+    for path in paths:
+        real = real_path(path)
+        if any(
+            real != root and os.path.commonpath([root, real]) == root
+            for root in roots
+        ):
+            # the walk of the directory containing it has already planned it
+            # against the listing, so planning it again would be stale
+            vprint("walked " + str(path))
+            continue
+        if real in roots and real not in walked:
+            walked.add(real)
+            for directory, entries in walk(path):
+                names = [entry.name for entry in entries]
+                renames = changes(directory, names)
+                yield from plan_directory(directory, renames, set(names), force)
+        groups.setdefault(path.parent, {}).update(changes(path.parent, [path.name]))
+
+    for directory, renames in groups.items():
+        if not renames:
+            continue
+        try:
+            with os.scandir(directory) as iterator:
+                existing = {entry.name for entry in iterator}
+        except OSError as err:
+            warn("{}: {}".format(directory, err.strerror))
+            continue
+        yield from plan_directory(directory, renames, existing, force)
+
+
+def batches(steps: Iterable[List[Rename]], size: int) -> Iterator[List[Rename]]:
+    """
+    group lists of renames which must be performed together into batches of
+    up to size renames; a list is never split, so may make a larger batch
+    """
+    batch: List[Rename] = []
+    for step in steps:
+        if batch and len(batch) + len(step) > size:
+            yield batch
+            batch = []
+        batch.extend(step)
+    if batch:
+        yield batch
+
+
 def main() -> None:
     """
     direct program entry point
@@ -207,6 +473,25 @@ def main() -> None:
         required=True,
         help="replacement text, in python string.format-style",
     )
+    argp.add_argument(
+        "-R",
+        "--recursive",
+        action="store_true",
+        help="also consider everything inside the directories among the paths, walking them depth-first",
+    )
+    argp.add_argument(
+        "-b",
+        "--batch-size",
+        type=positive_int,
+        default=DEFAULT_BATCH_SIZE,
+        help="with --recursive, the maximum number of renames to review and perform at a time",
+    )
+    argp.add_argument(
+        "-y",
+        "--yes",
+        action="store_true",
+        help="perform the renames without asking for confirmation",
+    )
     argp.add_argument(
         "path",
         nargs="+",
@@ -231,45 +516,43 @@ def main() -> None:
         counter=Counter(),
         debug=args.debug,
     )
-    vprint = functools.partial(cond_print, enable=args.verbose)
-
-    # the operations list will hold our rename task objects so they can be
-    # reviewed by the user before we perform them
-    operations: List[Rename] = []
 
-    for path in args.path:
-        new_name, match_count = search.subn(replace, path.name, args.maxreplace)
-        if not match_count:
-            vprint("non-match " + str(path))
-            continue
-        if new_name == path.name:
-            vprint("unchanged " + str(path))
+    # the operations are planned lazily, a directory at a time. a walk over a
+    # large tree is handled a batch at a time so that it never holds all of
+    # them, but the renames of the given paths alone are all reviewed at once
+    operations = plan_renames(
+        args.path,
+        search,
+        replace,
+        maxreplace=args.maxreplace,
+        recursive=args.recursive,
+        force=args.force,
+        verbose=args.verbose,
+    )
+    batch_size = args.batch_size if args.recursive else sys.maxsize
+    planned = False
+
+    for batch in batches(operations, batch_size):
+        planned = True
+        if args.dryrun:
+            for operation in batch:
+                operation.perform(dry_run=True, force=args.force, verbose=args.verbose)
             continue
-        operations.append(Rename(path, new_name))
 
-    if not operations:
+        if not args.yes:
+            # print the batch of operations, ask if the user wants to proceed
+            print("\n".join([str(op) for op in batch]))
+            response = confirm("Perform these operations? (y/N)? >")
+            if response is None:
+                sys.exit(1)
+            if not response:
+                sys.exit(0)
+        for operation in batch:
+            operation.perform(force=args.force, verbose=args.verbose)
+
+    if not planned:
         print("Nothing to do")
-        sys.exit(0)
-
-    if args.dryrun:
-        for operation in operations:
-            operation.perform(dry_run=True, force=args.force, verbose=args.verbose)
-        sys.exit(0)
-
-    # print the list of operations to perform, ask if the user wants to proceed
-    print("\n".join([str(op) for op in operations]))
-    for _ in range(3):
-        response = input("Perform these operations? (y/N)? >").strip().lower()
-        if response == "y":
-            for operation in operations:
-                operation.perform(force=args.force, verbose=args.verbose)
-            sys.exit(0)
-        elif response in ("n", ""):
-            sys.exit(0)
-        else:
-            print("Invalid response")
-
-    sys.exit(1)
+    sys.exit(0)
 
 
 def replacer(
@@ -331,6 +614,34 @@ def replacer(
     )
 
 
+def confirm(prompt: str, attempts: int = 3) -> Optional[bool]:
+    """
+    ask the user a y/N question; return True for yes, False for no (or just
+    enter), or None if no valid response was given in the number of attempts
+    """
+    for _ in range(attempts):
+        response = input(prompt).strip().lower()
+        if response == "y":
+            return True
+        if response in ("n", ""):
+            return False
+        print("Invalid response")
+    return None
+
+
+def positive_int(value: str) -> int:
+    """argparse type for integers greater than zero"""
+    try:
+        result = int(value)
+    except ValueError:
+        result = 0
+    if result < 1:
+        raise argparse.ArgumentTypeError(
+            "expected a positive integer: {!r}".format(value)
+        )
+    return result
+
+
 def cond_print(output: str, enable: bool = True) -> None:
     """
     print the given output string if "enable" is True
@@ -1,12 +1,36 @@
 #!/usr/bin/env python3
 import argparse
+import contextlib
 import functools
+import heapq
+import itertools
+import operator
 import re
 import sys
-from typing import Any, Final, NamedTuple, Type, TypeVar
+import tempfile
+from array import array
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Final,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
 T = TypeVar("T", bound="SemVer")
 
+# a precedence-ordered sort key for a SemVer, see SemVer.sort_key
+SemVerKey = Tuple[int, int, int, bool, Tuple[Tuple[int, Union[int, str]], ...]]
+
 
 # this program is dumb, you probably want https://pypi.org/project/semver/
 # I just had to stick with stdlib for this util... for reasons
@@ -45,6 +69,55 @@ SEMVER_MINOR: Final = "minor"
 SEMVER_PATCH: Final = "patch"
 SEMVER_PRERELEASE: Final = "prerelease"
 SEMVER_BUILDMETADATA: Final = "buildmetadata"
+SEMVER_PARTS: Final = (SEMVER_MAJOR, SEMVER_MINOR, SEMVER_PATCH)
+
+# a single comparator of a --satisfies range, e.g. ">=1.2", "^0.4.1" or "~2",
+# where any missing or x/X/* version part makes it a partial version
+COMPARATOR_REGEX: Final = re.compile(
+    # fmt: off
+    r"(?P<operator><=|>=|<|>|=|\^|~)?"
+    r"\s*[RVrv]?"
+    r"(?P<major>\d+|[xX*])"
+    r"(?:"
+        r"\.(?P<minor>\d+|[xX*])"
+        r"(?:"
+            r"\.(?P<patch>\d+|[xX*])"
+            r"(?:-(?P<prerelease>[0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?"
+            r"(?:\+[0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*)?"
+        r")?"
+    r")?"
+    r"\s*"
+    # fmt: on
+)
+HYPHEN_RANGE_REGEX: Final = re.compile(r"(\S+)\s+-\s+(\S+)")
+
+# the default number of distinct version strings SemVerCache keeps parsed
+DEFAULT_CACHE_SIZE: Final = 1 << 16
+
+# VersionStore stops counting distinct versions (and falls back to a
+# comparison sort) once there are more than this many
+MAX_DISTINCT_VERSIONS: Final = 1 << 16
+
+# rough per-line memory cost of a VersionStore, on top of the line's bytes:
+# its offset, version numbers and pre-release number, plus the packed key and
+# index order built to sort it
+STORE_OVERHEAD: Final = 52
+
+# the maximum number of sorted runs --buffer-size merges at once
+MAX_MERGE_FANIN: Final = 64
+
+# the units of --buffer-size, the same as those of hsort's --buffer-size: K,
+# M, G... (or KB, MB, GB...) are decimal and Ki, Mi, Gi... (or KiB, MiB,
+# GiB...) are binary
+BUFFER_SIZE_MULTIPLES: Final = {
+    **{"": 1, "B": 1, "b": 1, "k": 1000, "kB": 1000, "Kb": 1000},
+    **{
+        prefix + suffix: base**power
+        for power, prefix in enumerate("KMGTPEZY", 1)
+        for suffix, base in (("", 1000), ("B", 1000), ("i", 1024), ("iB", 1024))
+    },
+}
+BUFFER_SIZE_REGEX: Final = re.compile(r"(\d+)(?:\.(\d+))?\s*([A-Za-z]*)")
 
 
 def cmp(a: Any, b: Any) -> int:
@@ -52,6 +125,43 @@ def cmp(a: Any, b: Any) -> int:
     return (a > b) - (a < b)
 
 
+def candidate_start(input_string: str) -> int:
+    """
+    cheap pre-scan for SEMVER_REGEX, which is slow to search for because it
+    is tried at every position of the line: return the position from which
+    searching for it finds the first semver in input_string, or -1 if the
+    string can't contain one. every semver contains a dot between two digits
+    and has no dot before that one, so only such dots are looked at (using
+    str.find), and the search starts just before the digits leading up to
+    the first of them. lines without a digit-dot-digit sequence are rejected
+    without running the regex at all
+    """
+    start = 0
+    dot = input_string.find(".")
+    while dot != -1:
+        if (
+            dot
+            and input_string[dot - 1].isdigit()
+            and input_string[dot + 1 : dot + 2].isdigit()
+        ):
+            begin = dot - 1
+            while begin > start and input_string[begin - 1].isdigit():
+                begin -= 1
+            # allow for a leading "v"
+            return begin - 1 if begin > start else start
+        start = dot + 1
+        dot = input_string.find(".", start)
+    return -1
+
+
+def version_match(input_string: str) -> Optional["re.Match[str]"]:
+    """return the first SEMVER_REGEX match in input_string, or None"""
+    start = candidate_start(input_string)
+    if start < 0:
+        return None
+    return SEMVER_REGEX.search(input_string, start)
+
+
 class SemVer(NamedTuple):
     """Container for Semantic Versioning String data"""
 
@@ -61,18 +171,45 @@ class SemVer(NamedTuple):
     prerelease: str
     buildmetadata: str
 
+    @classmethod
+    def search(cls: Type[T], input_string: str) -> Optional[T]:
+        """return the first SemVer found in input_string, or None"""
+        match = version_match(input_string)
+        if match is None:
+            return None
+        major, minor, patch, prerelease, buildmetadata = match.group(
+            SEMVER_MAJOR,
+            SEMVER_MINOR,
+            SEMVER_PATCH,
+            SEMVER_PRERELEASE,
+            SEMVER_BUILDMETADATA,
+        )
+        return cls(
+            int(major),
+            int(minor),
+            int(patch),
+            prerelease or "",
+            buildmetadata or "",
+        )
+
+    @classmethod
+    def from_token(cls: Type[T], token: str) -> T:
+        """
+        return the SemVer of the text that SEMVER_REGEX matched, like
+        "v1.2.3-rc.1+build.5"; as it is known to be a valid version, it can be
+        split apart rather than matched again
+        """
+        core, _, buildmetadata = token.partition("+")
+        core, _, prerelease = core.partition("-")
+        major, minor, patch = core.lstrip("RVrv").split(".")
+        return cls(int(major), int(minor), int(patch), prerelease, buildmetadata)
+
     @classmethod
     def from_string(cls: Type[T], input_string: str) -> T:
-        if match := SEMVER_REGEX.search(input_string):
-            matches = match.groupdict()
-            return cls(
-                int(matches.get(SEMVER_MAJOR, 0)),
-                int(matches.get(SEMVER_MINOR, 0)),
-                int(matches.get(SEMVER_PATCH, 0)),
-                matches.get(SEMVER_PRERELEASE, "") or "",
-                matches.get(SEMVER_BUILDMETADATA, "") or "",
-            )
-        return cls(0, 0, 0, "", "")
+        version = cls.search(input_string)
+        if version is None:
+            return cls(0, 0, 0, "", "")
+        return version
 
     @classmethod
     def semver_cmp(cls: Type[T], a: T, b: T) -> int:
@@ -139,6 +276,32 @@ class SemVer(NamedTuple):
 
         return 0
 
+    def sort_key(self) -> SemVerKey:
+        """
+        return a tuple which orders SemVers by precedence, i.e. the same way
+        as semver_cmp, so that each version only needs to be parsed once:
+
+        (major, minor, patch, is_release, prerelease_identifiers)
+
+        is_release sorts normal versions after their pre-release versions, and
+        each pre-release identifier becomes (0, int) if it is numeric or
+        (1, str) otherwise, so numeric identifiers are compared numerically
+        and have lower precedence than non-numeric ones. a shorter tuple of
+        identifiers sorts first when all of its identifiers are equal
+        """
+        if not self.prerelease:
+            return (self.major, self.minor, self.patch, True, ())
+        return (
+            self.major,
+            self.minor,
+            self.patch,
+            False,
+            tuple(
+                (0, int(identifier)) if identifier.isnumeric() else (1, identifier)
+                for identifier in self.prerelease.split(".")
+            ),
+        )
+
 
 def semver_str_cmp(a_string: str, b_string: str) -> int:
     return SemVer.semver_cmp(
@@ -147,6 +310,505 @@ def semver_str_cmp(a_string: str, b_string: str) -> int:
     )
 
 
+class SemVerCache:
+    """
+    bounded LRU cache layer around SemVer.search, keyed on the text of the
+    version found in each line: each distinct version string is only parsed
+    once, however many lines it appears on, and they share the resulting
+    SemVer and its sort key. a maxsize of None makes the cache unbounded, 0
+    disables it (and skips the lru_cache wrappers entirely)
+    """
+
+    def __init__(self, maxsize: Optional[int] = DEFAULT_CACHE_SIZE) -> None:
+        self.enabled = maxsize != 0
+        self.search: Callable[[str], Optional[SemVer]] = SemVer.search
+        self._sort_key: Callable[[SemVer], SemVerKey] = SemVer.sort_key
+        self._parse: Callable[[str], SemVer] = SemVer.from_token
+        if self.enabled:
+            self._parse = functools.lru_cache(maxsize=maxsize)(SemVer.from_token)
+            self._sort_key = functools.lru_cache(maxsize=maxsize)(SemVer.sort_key)
+            self.search = self.cached_search
+
+    def cached_search(self, input_string: str) -> Optional[SemVer]:
+        """SemVer.search, with the version found looked up in the cache"""
+        match = version_match(input_string)
+        if match is None:
+            return None
+        return self._parse(match.group())
+
+    def from_string(self, input_string: str) -> SemVer:
+        """cached equivalent of SemVer.from_string"""
+        version = self.search(input_string)
+        if version is None:
+            return SemVer(0, 0, 0, "", "")
+        return version
+
+    def sort_key(self, input_string: str) -> SemVerKey:
+        """cached equivalent of SemVer.from_string(input_string).sort_key()"""
+        return self._sort_key(self.from_string(input_string))
+
+    def search_key(self, input_string: str) -> Optional[SemVerKey]:
+        """the sort key of the version in input_string, or None if it has none"""
+        version = self.search(input_string)
+        return None if version is None else self._sort_key(version)
+
+    def stats(self) -> str:
+        """return a description of the cache's effectiveness"""
+        if not self.enabled:
+            return "semver cache: disabled"
+        info = self._parse.cache_info()  # type: ignore
+        lookups = info.hits + info.misses
+        return "semver cache: {} hits, {} misses ({:.1%}), {}/{} entries".format(
+            info.hits,
+            info.misses,
+            info.hits / lookups if lookups else 0,
+            info.currsize,
+            "unbounded" if info.maxsize is None else info.maxsize,
+        )
+
+
+class VersionStore:
+    """
+    compact storage for input lines and their versions, for inputs too large
+    to keep a str, a SemVer and a sort key tuple per line. the lines are
+    packed end-to-end into a single utf-8 buffer and addressed by offset, the
+    major, minor and patch numbers are kept three per line in an array of
+    unsigned 64-bit integers (or a list, for numbers which don't fit one),
+    and each distinct pre-release is interned once and referred to by its
+    number. sorting is stable and works on line indices
+    """
+
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self.offsets = array("Q", [0])
+        self.numbers: Union["array[int]", List[int]] = array("Q")
+        self.prereleases = array("I")
+        # the number of each distinct pre-release, "" is a normal version
+        self.prerelease_ids: Dict[str, int] = {"": 0}
+
+    def __len__(self) -> int:
+        return len(self.prereleases)
+
+    def append(self, version: SemVer, line: str) -> None:
+        """add a line and its version to the store"""
+        self.buffer += line.encode("utf-8", "surrogateescape")
+        self.offsets.append(len(self.buffer))
+        try:
+            self.numbers.extend(version[:3])
+        except OverflowError:
+            # drop whichever numbers did fit before switching to a list
+            del self.numbers[3 * len(self.prereleases) :]
+            self.numbers = list(self.numbers)
+            self.numbers.extend(version[:3])
+        prerelease_id = self.prerelease_ids.get(version.prerelease)
+        if prerelease_id is None:
+            prerelease_id = len(self.prerelease_ids)
+            self.prerelease_ids[version.prerelease] = prerelease_id
+        self.prereleases.append(prerelease_id)
+
+    def prerelease_ranks(self) -> "array[int]":
+        """
+        return the precedence rank of each interned pre-release by number;
+        normal versions rank after all pre-releases, and pre-releases of
+        equal precedence share a rank
+        """
+        ranks = array("I", bytes(4 * len(self.prerelease_ids)))
+        rank = -1
+        previous = None
+        for key, prerelease_id in sorted(
+            (SemVer(0, 0, 0, prerelease, "").sort_key()[3:], prerelease_id)
+            for prerelease, prerelease_id in self.prerelease_ids.items()
+        ):
+            if key != previous:
+                rank += 1
+                previous = key
+            ranks[prerelease_id] = rank
+        return ranks
+
+    def order(self) -> "array[int]":
+        """
+        return the line indices ordered by version. each version is packed
+        into one integer with major, minor, patch and pre-release rank bit
+        fields, so that the sort compares ints rather than tuples. there are
+        usually far fewer distinct versions than lines, then this is a
+        counting sort over the distinct versions which needs no per-line
+        objects. otherwise it falls back to a regular sort of the indices
+        """
+        numbers = self.numbers
+        ranks = self.prerelease_ranks()
+        major_bits, minor_bits, patch_bits = (
+            max(itertools.islice(numbers, part, None, 3), default=0).bit_length()
+            for part in range(3)
+        )
+        rank_bits = max(ranks, default=0).bit_length()
+
+        keys: Union["array[int]", List[int]] = array("Q")
+        if major_bits + minor_bits + patch_bits + rank_bits > 64:
+            keys = []
+        counts: Optional[Dict[int, int]] = {}
+        for major, minor, patch, prerelease_id in zip(
+            itertools.islice(numbers, 0, None, 3),
+            itertools.islice(numbers, 1, None, 3),
+            itertools.islice(numbers, 2, None, 3),
+            self.prereleases,
+        ):
+            key = (major << minor_bits) | minor
+            key = (((key << patch_bits) | patch) << rank_bits) | ranks[prerelease_id]
+            keys.append(key)
+            if counts is not None:
+                counts[key] = counts.get(key, 0) + 1
+                if len(counts) > MAX_DISTINCT_VERSIONS:
+                    counts = None
+
+        if counts is None:
+            return array("Q", sorted(range(len(keys)), key=keys.__getitem__))
+
+        # starts[rank] is the position of the next line having that version
+        key_ranks = {}
+        starts = array("Q")
+        position = 0
+        for rank, key in enumerate(sorted(counts)):
+            key_ranks[key] = rank
+            starts.append(position)
+            position += counts[key]
+
+        order = array("Q", bytes(8 * len(keys)))
+        for index, key in enumerate(keys):
+            rank = key_ranks[key]
+            order[starts[rank]] = index
+            starts[rank] += 1
+        return order
+
+    def sorted_lines(self) -> Iterator[str]:
+        """generate the stored lines ordered by version"""
+        data = self.buffer
+        offsets = self.offsets
+        for index in self.order():
+            yield data[offsets[index] : offsets[index + 1]].decode(
+                "utf-8", "surrogateescape"
+            )
+
+
+# a comparison of a version's sort key against a bound, e.g. (operator.ge, key)
+Bound = Tuple[Callable[[SemVerKey, SemVerKey], bool], SemVerKey]
+
+
+# the comparisons of sort keys against full versions
+COMPARATORS: Final = {
+    "=": operator.eq,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+
+def lowest_key(major: int, minor: int, patch: int) -> SemVerKey:
+    """the sort key below every version (pre-release or not) of major.minor.patch"""
+    return (major, minor, patch, False, ())
+
+
+def comparator_bounds(match: "re.Match[str]") -> List[Bound]:
+    """
+    desugar a COMPARATOR_REGEX match into the bounds a sort key must satisfy,
+    following npm: a partial version like "1.2" stands for the range of
+    versions it leaves open (1.2.0 up to, but not including, 1.3.0), tilde
+    allows patch updates ("~1.2.3" is >=1.2.3 <1.3.0, "~1" is 1.x), and caret
+    allows updates which don't change the leftmost non-zero part ("^0.2.3" is
+    >=0.2.3 <0.3.0)
+    """
+    operator_str = match.group("operator") or "="
+    parts: List[int] = []
+    for name in SEMVER_PARTS:
+        part = match.group(name)
+        if part is None or not part.isdigit():
+            break
+        parts.append(int(part))
+
+    if not parts:
+        # "*" and friends match any version, or none at all for "<*" and ">*"
+        return [(operator.lt, lowest_key(0, 0, 0))] if operator_str in "<>" else []
+
+    major, minor, patch = parts + [0] * (3 - len(parts))
+    if len(parts) == 3:
+        exact = SemVer(major, minor, patch, match.group("prerelease") or "", "")
+        lower = exact.sort_key()
+        upper = lower
+    else:
+        lower = lowest_key(major, minor, patch)
+        if len(parts) == 1:
+            upper = lowest_key(major + 1, 0, 0)
+        else:
+            upper = lowest_key(major, minor + 1, 0)
+
+    if operator_str == "~":
+        if len(parts) == 1:
+            tilde = lowest_key(major + 1, 0, 0)
+        else:
+            tilde = lowest_key(major, minor + 1, 0)
+        return [(operator.ge, lower), (operator.lt, tilde)]
+    if operator_str == "^":
+        if major or len(parts) == 1:
+            caret = lowest_key(major + 1, 0, 0)
+        elif minor or len(parts) == 2:
+            caret = lowest_key(0, minor + 1, 0)
+        else:
+            caret = lowest_key(0, 0, patch + 1)
+        return [(operator.ge, lower), (operator.lt, caret)]
+    if len(parts) == 3:
+        return [(COMPARATORS[operator_str], lower)]
+    return {
+        "=": [(operator.ge, lower), (operator.lt, upper)],
+        ">": [(operator.ge, upper)],
+        ">=": [(operator.ge, lower)],
+        "<": [(operator.lt, lower)],
+        "<=": [(operator.lt, upper)],
+    }[operator_str]
+
+
+def compile_range(spec: str) -> Callable[[SemVerKey], bool]:
+    """
+    compile a single range of comparators which must all hold, separated by
+    spaces or commas, or a hyphen range like "1.2 - 2.3.4", into a predicate
+    over sort keys. as with npm, a pre-release version only satisfies the
+    range if one of its comparators is a pre-release of the same
+    major.minor.patch, so ">=1.2.3-beta" allows 1.2.3-rc.1 but not 1.3.0-rc.1
+    """
+    spec = spec.replace(",", " ").strip()
+    hyphen = HYPHEN_RANGE_REGEX.fullmatch(spec)
+    if hyphen:
+        spec = ">={} <={}".format(*hyphen.groups())
+
+    bounds: List[Bound] = []
+    prereleases = set()
+    position = 0
+    while position < len(spec):
+        match = COMPARATOR_REGEX.match(spec, position)
+        if match is None:
+            raise ValueError("invalid version constraint: {!r}".format(spec))
+        bounds.extend(comparator_bounds(match))
+        parts = [match.group(name) for name in SEMVER_PARTS]
+        if match.group("prerelease") and all(part.isdigit() for part in parts):
+            prereleases.add(tuple(map(int, parts)))
+        position = match.end()
+
+    def satisfies(key: SemVerKey) -> bool:
+        if not key[3] and key[:3] not in prereleases:
+            return False
+        return all(compare(key, bound) for compare, bound in bounds)
+
+    return satisfies
+
+
+def compile_constraint(spec: str) -> Callable[[SemVerKey], bool]:
+    """
+    compile an npm/cargo-style version constraint like ">=1.2 <2.0",
+    "^1.4 || ~2.0.3" or "1.x" into a predicate over SemVer sort keys,
+    see compile_range. raises ValueError for invalid constraints
+    """
+    ranges = [compile_range(spec) for spec in spec.split("||")]
+    if len(ranges) == 1:
+        return ranges[0]
+    return lambda key: any(satisfies(key) for satisfies in ranges)
+
+
+def constraint_type(value: str) -> Callable[[SemVerKey], bool]:
+    """argparse type for --satisfies"""
+    try:
+        return compile_constraint(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err)) from err
+
+
+def filter_lines(
+    lines: Iterable[str],
+    satisfies: Callable[[SemVerKey], bool],
+    search_key: Callable[[str], Optional[SemVerKey]],
+) -> Iterator[str]:
+    """yield the lines whose version satisfies the constraint, see SemVerCache"""
+    for line in lines:
+        key = search_key(line)
+        if key is not None and satisfies(key):
+            yield line
+
+
+def group_func(spec: str) -> Callable[[str], Optional[str]]:
+    """
+    return a function which extracts the group name from a line, according to
+    the given --group-by spec: a number selects that (1-based) whitespace
+    separated field, anything else is a regex whose first capture group (or
+    whole match, if it has no groups) is the group name. the function returns
+    None for lines which have no group
+    """
+    if spec.isdigit():
+        index = int(spec) - 1
+
+        def field(line: str) -> Optional[str]:
+            fields = line.split(None, index + 1)
+            return fields[index] if index < len(fields) else None
+
+        return field
+
+    regex = re.compile(spec)
+    group = 1 if regex.groups else 0
+
+    def match(line: str) -> Optional[str]:
+        found = regex.search(line)
+        return found.group(group) if found else None
+
+    return match
+
+
+def best_per_group(
+    lines: Iterable[str],
+    group: Callable[[str], Optional[str]],
+    search_key: Callable[[str], Optional[SemVerKey]],
+    oldest: bool = False,
+) -> Dict[str, str]:
+    """
+    stream the given lines, keeping only the line with the latest (or oldest)
+    version of each group; returns a dict of group name to line, in the order
+    the groups were first seen. on ties the first line seen is kept. lines
+    with no group or no version are dropped
+    """
+    best: Dict[str, Tuple[SemVerKey, str]] = {}
+    for line in lines:
+        name = group(line)
+        if name is None:
+            continue
+        key = search_key(line)
+        if key is None:
+            continue
+        current = best.get(name)
+        if current is None or (key < current[0] if oldest else key > current[0]):
+            best[name] = (key, line)
+    return {name: line for name, (_, line) in best.items()}
+
+
+def semver_records(
+    lines: Iterable[str], sort_key: Callable[[str], SemVerKey]
+) -> Iterator[Tuple[SemVerKey, str]]:
+    """
+    yield (sort key, line) tuples for the given lines, adding the missing
+    newline to a last line so that it can't run into the next one
+    """
+    for line in lines:
+        if not line.endswith("\n"):
+            line += "\n"
+        yield sort_key(line), line
+
+
+def parse_buffer_size(value: str) -> int:
+    """
+    argparse type for memory budgets like "512M", "1.5GB" or "2GiB": a number
+    of bytes with an optional unit from BUFFER_SIZE_MULTIPLES
+    """
+    match = BUFFER_SIZE_REGEX.fullmatch(value.strip())
+    multiple = BUFFER_SIZE_MULTIPLES.get(match.group(3)) if match else None
+    if match is None or multiple is None:
+        raise argparse.ArgumentTypeError("invalid buffer size: {!r}".format(value))
+    whole, fraction = match.group(1), match.group(2) or ""
+    size = int(whole + fraction) * multiple // 10 ** len(fraction)
+    if size < 1:
+        raise argparse.ArgumentTypeError("size must be at least 1 byte")
+    return size
+
+
+def spill(lines: Iterable[str]) -> IO[str]:
+    """
+    write the given (already sorted) lines to a temporary file and return it,
+    rewound to the beginning and ready for reading
+    """
+    runfile = tempfile.TemporaryFile(
+        "w+", encoding="utf-8", errors="surrogateescape"
+    )
+    runfile.writelines(lines)
+    runfile.seek(0)
+    return runfile
+
+
+class SpilledRuns:
+    """
+    the sorted runs of lines spilled to temporary files by sort_lines. runs
+    are added at level 0, and a level which reaches MAX_MERGE_FANIN runs is
+    merged into a single run one level up, so at most MAX_MERGE_FANIN runs
+    per level are ever open. higher levels only hold older lines, so merging
+    them from the top level down keeps the sort stable
+    """
+
+    def __init__(self, stack: contextlib.ExitStack, sort_key: Callable) -> None:
+        self.stack = stack
+        self.sort_key = sort_key
+        self.levels: List[List[IO[str]]] = []
+
+    def __bool__(self) -> bool:
+        return any(self.levels)
+
+    def add(self, lines: Iterable[str], level: int = 0) -> None:
+        """spill the given sorted lines as the newest run of a level"""
+        if level == len(self.levels):
+            self.levels.append([])
+        runs = self.levels[level]
+        runs.append(self.stack.enter_context(spill(lines)))
+        if len(runs) == MAX_MERGE_FANIN:
+            self.levels[level] = []
+            self.add(self.merge(runs), level + 1)
+            for runfile in runs:
+                runfile.close()
+
+    def merge(self, runs: List[IO[str]]) -> Iterator[str]:
+        """k-way merge the lines of the given runs, oldest run first on ties"""
+        records = heapq.merge(
+            *[semver_records(runfile, self.sort_key) for runfile in runs],
+            key=operator.itemgetter(0),
+        )
+        return map(operator.itemgetter(1), records)
+
+    def lines(self) -> Iterator[str]:
+        """merge all of the runs"""
+        return self.merge(
+            [runfile for runs in reversed(self.levels) for runfile in runs]
+        )
+
+
+def sort_lines(
+    lines: Iterable[str],
+    cache: SemVerCache,
+    buffer_size: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    stable sort of the given lines by version, each line is parsed once as it
+    is added to a VersionStore. with a buffer_size, no more than (roughly)
+    that many bytes of stored lines are held in memory: full stores are
+    sorted and spilled to SpilledRuns, which are merged on their sort keys
+    """
+    with contextlib.ExitStack() as stack:
+        runs = SpilledRuns(stack, cache.sort_key)
+        store = VersionStore()
+        for line in lines:
+            if not line.endswith("\n"):
+                line += "\n"
+            store.append(cache.from_string(line), line)
+            if buffer_size is None:
+                continue
+            if len(store.buffer) + STORE_OVERHEAD * len(store) >= buffer_size:
+                runs.add(store.sorted_lines())
+                store = VersionStore()
+
+        if not runs:
+            # everything fit in the buffer, no need to touch the disk
+            for line in store.sorted_lines():
+                yield line
+            return
+
+        if store:
+            runs.add(store.sorted_lines())
+        del store
+
+        for line in runs.lines():
+            yield line
+
+
 def main() -> int:
     """
     entrypoint for direct execution; returns an integer suitable for use with sys.exit
@@ -157,7 +819,13 @@ def main() -> int:
     argp.add_argument(
         "--debug",
         action="store_true",
-        help="enable debug output",
+        help="enable debug output, including version parsing cache statistics",
+    )
+    argp.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="the number of distinct version strings whose parsed versions are cached, so that a version which appears on many lines is only parsed once; 0 disables the cache, -1 makes it unbounded",
     )
     argp.add_argument(
         "input",
@@ -166,13 +834,82 @@ def main() -> int:
         nargs="*",
         help="file(s) whose lines should be read, sorted, and printed",
     )
+    argp.add_argument(
+        "-g",
+        "--group-by",
+        metavar="REGEX|FIELD",
+        help="instead of sorting, print only the latest version of each group of lines; groups are named by the first capture group of REGEX or by whitespace-separated FIELD number; lines without a version are dropped",
+    )
+    argp.add_argument(
+        "-G",
+        "--global",
+        action="store_true",
+        dest="global_sort",
+        help="sort the lines of all input files together, instead of sorting each file separately",
+    )
+    argp.add_argument(
+        "-S",
+        "--buffer-size",
+        type=parse_buffer_size,
+        metavar="SIZE",
+        help="sort at most SIZE bytes (e.g. '512M' or '2GiB', in the same units as hsort) of lines in memory at a time, spilling sorted runs to temporary files",
+    )
+    argp.add_argument(
+        "-s",
+        "--satisfies",
+        type=constraint_type,
+        metavar="RANGE",
+        help="only keep lines whose version satisfies the npm-style RANGE, e.g. '>=1.2 <2.0', '^1.4 || ~2.0.3' or '1.x'; lines without a version are dropped",
+    )
+    selection = argp.add_mutually_exclusive_group()
+    selection.add_argument(
+        "--latest",
+        action="store_false",
+        dest="oldest",
+        default=False,
+        help="with --group-by, print the latest version of each group (the default)",
+    )
+    selection.add_argument(
+        "--oldest",
+        action="store_true",
+        help="with --group-by, print the oldest version of each group",
+    )
     args = argp.parse_args()
 
-    semver_keyfunc = functools.cmp_to_key(semver_str_cmp)
+    if args.group_by is not None and args.group_by.isdigit() and int(args.group_by) < 1:
+        argp.error("--group-by field numbers start at 1")
+
+    cache = SemVerCache(None if args.cache_size < 0 else args.cache_size)
+
+    inputs: List[Iterable[str]] = args.input
+    if args.satisfies is not None:
+        inputs = [
+            filter_lines(lines, args.satisfies, cache.search_key) for lines in inputs
+        ]
+
+    if args.group_by is not None:
+        try:
+            group = group_func(args.group_by)
+        except re.error as err:
+            argp.error("invalid --group-by regex: {}".format(err))
+        best = best_per_group(
+            itertools.chain.from_iterable(inputs),
+            group,
+            cache.search_key,
+            oldest=args.oldest,
+        )
+        for line in best.values():
+            print(line, end="" if line.endswith("\n") else "\n")
+    else:
+        if args.global_sort:
+            inputs = [itertools.chain.from_iterable(inputs)]
+        for lines in inputs:
+            sys.stdout.writelines(
+                sort_lines(lines, cache, buffer_size=args.buffer_size)
+            )
 
-    for file in args.input:
-        for line in sorted(file, key=semver_keyfunc):
-            print(line, end="")
+    if args.debug:
+        print(cache.stats(), file=sys.stderr)
 
     return 0
 
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+micro-benchmarks for the version parsing in semversort.py; the total line
+count is reached by cycling through a smaller pool of generated tag list
+lines so that memory use stays low even for runs of tens of millions of lines
+"""
+import argparse
+import itertools
+import random
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+import semversort
+
+SAMPLE_PRERELEASES = ["", "", "", "-rc.1", "-beta.2", "-alpha", "-0.3.7", "-x.7.z.92"]
+
+
+def sample_lines(count: int, seed: int = 0) -> List[str]:
+    """
+    return count pseudo-random lines that look like git tags, container image
+    tags and pinned requirements, with some versionless log lines mixed in
+    """
+    rng = random.Random(seed)
+    lines = []
+    for index in range(count):
+        version = "{}.{}.{}{}".format(
+            rng.randrange(4),
+            rng.randrange(40),
+            rng.randrange(100),
+            rng.choice(SAMPLE_PRERELEASES),
+        )
+        kind = rng.random()
+        if kind < 0.3:
+            line = "refs/tags/v{}".format(version)
+        elif kind < 0.5:
+            line = "registry.example.com/team/service-{}:{}-alpine3.19".format(
+                index % 97, version
+            )
+        elif kind < 0.7:
+            line = "package-{}=={}".format(index % 313, version)
+        else:
+            line = "{:040x} Merge pull request #{} from team/feature-{}".format(
+                rng.getrandbits(160), index, index % 17
+            )
+        lines.append(line + "\n")
+    return lines
+
+
+def legacy_from_string(input_string: str) -> Optional[semversort.SemVer]:
+    """SemVer.search as it was before the candidate_start pre-scan"""
+    if match := semversort.SEMVER_REGEX.search(input_string):
+        matches = match.groupdict()
+        return semversort.SemVer(
+            int(matches.get(semversort.SEMVER_MAJOR, 0)),
+            int(matches.get(semversort.SEMVER_MINOR, 0)),
+            int(matches.get(semversort.SEMVER_PATCH, 0)),
+            matches.get(semversort.SEMVER_PRERELEASE, "") or "",
+            matches.get(semversort.SEMVER_BUILDMETADATA, "") or "",
+        )
+    return None
+
+
+def bench_regex(lines: Iterable[str]) -> None:
+    """the full SEMVER_REGEX search on each line"""
+    for line in lines:
+        legacy_from_string(line)
+
+
+def bench_tokenizer(lines: Iterable[str]) -> None:
+    """SemVer.from_string on each line"""
+    from_string = semversort.SemVer.from_string
+    for line in lines:
+        from_string(line)
+
+
+def bench_cached(lines: Iterable[str]) -> None:
+    """SemVerCache.from_string on each line, with the default cache size"""
+    from_string = semversort.SemVerCache().from_string
+    for line in lines:
+        from_string(line)
+
+
+BENCHMARKS: Dict[str, Callable[[Iterable[str]], None]] = {
+    "regex": bench_regex,
+    "tokenizer": bench_tokenizer,
+    "cached": bench_cached,
+}
+
+
+def main() -> int:
+    """
+    entrypoint for direct execution; returns an integer suitable for use with sys.exit
+    """
+    argp = argparse.ArgumentParser(description="benchmark semversort version parsing")
+    argp.add_argument(
+        "-n",
+        "--lines",
+        type=int,
+        default=10_000_000,
+        help="the total number of lines to parse per benchmark",
+    )
+    argp.add_argument(
+        "--pool",
+        type=int,
+        default=1_000_000,
+        help="the number of distinct generated lines to cycle through",
+    )
+    argp.add_argument(
+        "-b",
+        "--benchmark",
+        action="append",
+        choices=list(BENCHMARKS),
+        help="a benchmark to run, may be given more than once; defaults to all of them",
+    )
+    args = argp.parse_args()
+
+    pool = sample_lines(args.pool)
+
+    print("{:<12} {:>10} {:>14}".format("BENCHMARK", "SECONDS", "LINES/SECOND"))
+    for name in args.benchmark or BENCHMARKS:
+        lines = itertools.islice(itertools.cycle(pool), args.lines)
+        start = time.perf_counter()
+        BENCHMARKS[name](lines)
+        elapsed = time.perf_counter() - start
+        print("{:<12} {:>10.2f} {:>14,.0f}".format(name, elapsed, args.lines / elapsed))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())